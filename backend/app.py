@@ -1,16 +1,33 @@
-from flask import Flask, flash, g, jsonify, request
+from flask import Flask, Response, flash, g, jsonify, request, stream_with_context
 from flask_cors import CORS
 from flask_login import login_user, LoginManager, current_user, logout_user, login_required
 from flask_mail import Mail, Message
-from werkzeug import security
 from datetime import datetime, timedelta
 from utils import User
-from flask import Flask, render_template
-from dateutil.relativedelta import relativedelta
+from time import perf_counter
+import base64
+import cProfile
+import json
+import os
+import sqlite3
+import sys
+import uuid
 
 # Import your database functions and other dependencies
-from gpt import run_model
-from database import create_connection, DATABASE_FILE, get_account_transactions, add_file_transaction_data, add_file_account_data, add_transaction, init_db, get_all_transaction_data, get_user, add_user, get_user_accounts, get_user_transactions, update_conversation, get_dialogue, get_expenses_per_category, get_transactions_in_time
+from gpt import run_model, stream_model
+from llm_client import LLMBusyError
+from llm_cache import get_completion_cache
+from category_cache import get_category_cache
+from user_cache import get_user_cache
+from passwords import HasherBusyError, get_login_throttle, get_password_hasher
+from chat_context import build_context, record_message
+from retrieval import build_financial_context
+from jobs import enqueue_job, get_job
+from digest import collect_digests, percent_change, render_digest
+from metrics import InstrumentedConnection, REQUEST_SECONDS, REQUEST_SQL_QUERIES, REQUEST_SQL_SECONDS, render_metrics, start_request_stats
+from uploads import UPLOAD_MAX_BYTES, UploadTooLarge, receive_transaction_csv, save_upload, unique_upload_path
+from database.pool import ConnectionPool, PoolExhaustedError
+from database import create_connection, DATABASE_FILE, get_account_transactions, add_file_transaction_data, add_file_account_data, add_transaction, init_db, bootstrap_db, get_all_transaction_data, get_user, add_user, change_password, get_user_accounts, get_user_transactions, iter_user_transactions, get_user_transactions_page, get_spending_by_category, get_spending_buckets, rebuild_daily_totals, get_expenses_per_category, get_transactions_in_time
 
 # Initialize the app and configure the secret key
 app = Flask(__name__)
@@ -19,63 +36,199 @@ app.secret_key = "scrumptious"
 # Suppress emails during development. Change to False for production
 app.config['MAIL_SUPPRESS_SEND'] = True
 
+# Refuse request bodies larger than the upload limit (UPLOAD_MAX_MB)
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_BYTES
+
 # Configure CORS for the app and allow credentials
 CORS(app, supports_credentials=True)
 
 # Create mail handler
 mail = Mail(app)
 
-# Initialize the database
-def initialise_db():
-    db = create_connection(f'database/{DATABASE_FILE}')
-    init_db(db)
+# Location of the database, overridable for scratch databases
+DATABASE_PATH = os.getenv("WHACK_DATABASE", f'database/{DATABASE_FILE}')
+
+# Make sure the schema exists. Existing data is never touched; the sample data is only
+# loaded when WHACK_SEED_DB=1 is set or through the seed-db command.
+def initialise_db(seed=os.getenv("WHACK_SEED_DB") == "1"):
+    db = create_connection(DATABASE_PATH)
+    try:
+        bootstrap_db(db, seed=seed)
+    finally:
+        db.close()
 
 initialise_db()
 
-# Provide a database connection
+# Load the sample data into an empty database: flask --app app seed-db
+@app.cli.command("seed-db")
+def seed_db_command():
+    initialise_db(seed=True)
+
+# Recompute the daily spending rollup from the transactions: flask --app app rebuild-rollups
+@app.cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    db = create_connection(DATABASE_PATH)
+    try:
+        rebuild_daily_totals(db)
+    finally:
+        db.close()
+
+# Drop everything and reload the sample data: flask --app app reset-db
+@app.cli.command("reset-db")
+def reset_db_command():
+    db = create_connection(DATABASE_PATH)
+    try:
+        init_db(db)
+    finally:
+        db.close()
+
+# Connections are reused across requests: read-only connections for queries and a single
+# write connection, so dashboard reads are not blocked behind uploads
+db_pool = ConnectionPool(DATABASE_PATH, readers=int(os.getenv("WHACK_DB_READERS", 8)), factory=InstrumentedConnection)
+
+# Provide a read-only database connection
 def get_db():
     if 'db' not in g:
-        g.db = create_connection(f'database/{DATABASE_FILE}')
+        g.db = db_pool.acquire_reader()
     return g.db
 
-# Close database connection on shutdown
+# Provide the write connection, held until the end of the request
+def get_write_db():
+    if 'write_db' not in g:
+        g.write_db = db_pool.acquire_writer()
+    return g.write_db
+
+# Return database connections to the pool at the end of the request
 @app.teardown_appcontext
 def close_db(exception):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        db_pool.release_reader(db)
+    write_db = g.pop('write_db', None)
+    if write_db is not None:
+        db_pool.release_writer(write_db)
+
+# Requests sent with an "X-Profile: 1" header are run under cProfile and the stats dumped to
+# PROFILE_DIR, when profiling is switched on with WHACK_PROFILING=1 or in debug mode
+PROFILE_DIR = os.getenv("WHACK_PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+
+def profiling_enabled():
+    return app.debug or os.getenv("WHACK_PROFILING") == "1"
+
+# Starts timing the request and counting its SQL
+@app.before_request
+def start_request_metrics():
+    g.request_start = perf_counter()
+    g.request_stats = start_request_stats()
+    if request.headers.get("X-Profile") == "1" and profiling_enabled():
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            g.profiler = profiler
+        except ValueError:
+            # Another request on this interpreter is already being profiled
+            pass
+
+# Records the request's latency and SQL usage once the response has been sent in full, so
+# streamed responses are measured to their last byte
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop("request_start", None)
+    if start is None:
+        return response
+    stats = g.pop("request_stats")
+    profiler = g.pop("profiler", None)
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    method = request.method
+    status = response.status_code
+    profile_path = None
+    if profiler is not None:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile_path = os.path.join(PROFILE_DIR, f"{endpoint.strip('/').replace('/', '_') or 'root'}-{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}.prof")
+        response.headers["X-Profile-File"] = profile_path
+
+    def finished():
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        REQUEST_SECONDS.observe(perf_counter() - start, endpoint=endpoint, method=method, status=status)
+        REQUEST_SQL_QUERIES.observe(stats.queries, endpoint=endpoint)
+        REQUEST_SQL_SECONDS.observe(stats.sql_seconds, endpoint=endpoint)
+
+    response.call_on_close(finished)
+    return response
+
+# Prometheus metrics for this process: request latency, SQL per request and model timings
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
 
 # Initialize login manager
 login_manager = LoginManager()
 login_manager.init_app(app)
 
-# Defines how the login manager gets the current user
+# Defines how the login manager gets the current user. Users are cached per process for
+# USER_CACHE_TTL seconds, so most authenticated requests do not take a database connection here.
 @login_manager.user_loader
 def load_user(username):
-    db = get_db()
-    return get_user(db, username)
+    return get_user_cache().load(get_db, username)
 
 # Defines what happens when an unauthorized user attempts to access a page that requires login
 @login_manager.unauthorized_handler
 def unauthorized_callback():
     return jsonify({"error": "Unauthorized"}), 401
 
-# Send a POST request with login details to log in a user
+# Responses for requests turned away by the login throttle or a full hashing queue
+def too_many_attempts(retry_after):
+    response = jsonify(successful=False, error="Too many attempts, try again later")
+    response.headers["Retry-After"] = str(int(retry_after) + 1)
+    return response, 429
+
+@app.errorhandler(HasherBusyError)
+def hasher_busy(error):
+    response = jsonify(successful=False, error="Server busy, try again shortly")
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+# Every pooled database connection stayed busy for the whole acquire timeout
+@app.errorhandler(PoolExhaustedError)
+def pool_exhausted(error):
+    response = jsonify(successful=False, error="Server busy, try again shortly")
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+# Send a POST request with login details to log in a user. Attempts are throttled per client
+# address and failed attempts per username; the password check runs in the hashing pool, and
+# hashes made with outdated parameters are replaced with ones using the current method.
 @app.route("/login", methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         data = request.get_json()
         username = data.get("username")
         password = data.get("password")
+        throttle = get_login_throttle()
+        retry_after = throttle.check(request.remote_addr, username)
+        if retry_after:
+            return too_many_attempts(retry_after)
+        throttle.attempt(request.remote_addr)
+
         db = get_db()
         user = get_user(db, username)
+        hasher = get_password_hasher()
         if user == None:
+            throttle.failed(username)
             flash("Incorrect Username or Password!")
             return jsonify(successful=False)
-        elif not security.check_password_hash(user.password, password):
+        elif not hasher.verify(user.password, password or ""):
+            throttle.failed(username)
             flash("Incorrect username or password")
             return jsonify(successful=False) 
         else:
+            throttle.succeeded(username)
+            if hasher.needs_rehash(user.password):
+                user.password = hasher.hash(password)
+                change_password(get_write_db(), user.id, user.password)
+            get_user_cache().put(user)
             login_user(user)
             return jsonify(successful=True)
     elif request.method == 'GET':
@@ -91,18 +244,53 @@ def register():
     username = data.get("username")
     email = data.get("email")
     password = data.get("password")
+    throttle = get_login_throttle()
+    retry_after = throttle.addresses.retry_after(request.remote_addr)
+    if retry_after:
+        return too_many_attempts(retry_after)
+    throttle.attempt(request.remote_addr)
+
+    # Checked before paying for the password hash; the unique index catches a concurrent registration
+    if get_user(get_db(), username) is not None:
+        return jsonify(success=False, error="Username taken"), 409
     
     # Create a new User object without passing arguments to the constructor
     user = User()
     user.username = username
     user.email = email
-    user.password = security.generate_password_hash(password)
+    user.password = get_password_hasher().hash(password)
     
-    db = get_db()
-    add_user(db, user)
+    db = get_write_db()
+    try:
+        add_user(db, user)
+    except sqlite3.IntegrityError:
+        db.rollback()
+        return jsonify(success=False, error="Username taken"), 409
+    get_user_cache().invalidate(username)
     login_user(user)
     return jsonify(success=True)
 
+# Send a POST request with the current and new password to change the current user's password
+@app.route("/change_password", methods=['POST'])
+@login_required
+def change_user_password():
+    data = request.get_json()
+    throttle = get_login_throttle()
+    retry_after = throttle.check(request.remote_addr, current_user.username)
+    if retry_after:
+        return too_many_attempts(retry_after)
+    throttle.attempt(request.remote_addr)
+    hasher = get_password_hasher()
+    if not hasher.verify(current_user.password, data.get("old_password") or ""):
+        throttle.failed(current_user.username)
+        return jsonify(success=False), 403
+    new_password = data.get("new_password")
+    if not new_password:
+        return jsonify(success=False), 400
+    change_password(get_write_db(), current_user.id, hasher.hash(new_password))
+    get_user_cache().invalidate(current_user.username)
+    return jsonify(success=True)
+
 # Send a GET request with a username to check if it is taken
 @app.route("/check_username", methods=['GET'])
 def check_username():
@@ -133,52 +321,236 @@ def home():
 @login_required
 def user_accounts():
     db = get_db()
-    account_info = get_user_accounts(db, current_user.username)
+    account_info = get_user_accounts(db, current_user.id)
     return jsonify(account_info)
 
-#Send information on all the transaction of the current user
+#Projects the current user's account balances with monthly compound interest.
+#Query arguments: horizon (months, default 12) and step (months between points, default 1).
+@app.route("/projections", methods = ['GET'])
+@login_required
+def projections():
+    # NumPy is only imported once projections are first asked for
+    from projections import MAX_HORIZON, horizons, project_user
+    try:
+        horizon = int(request.args.get("horizon", 12))
+        step = int(request.args.get("step", 1))
+    except ValueError:
+        return jsonify({"error": "Invalid query arguments"}), 400
+    if not 0 <= horizon <= MAX_HORIZON or step < 1:
+        return jsonify({"error": f"horizon must be between 0 and {MAX_HORIZON} and step at least 1"}), 400
+    return jsonify(project_user(get_db(), current_user.id, horizons(horizon, step)))
+
+# Opaque pagination cursors wrap the (time, id) of the last row on a page
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def decode_cursor(cursor):
+    time, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return (time, int(row_id))
+
+# Parses a start/end query argument. Dates without a time cover the whole day, so the
+# exclusive end bound is moved on to the following midnight.
+def parse_time_arg(value, end=False):
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end and len(value) <= 10:
+        parsed += timedelta(days=1)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+#Send information on all the transaction of the current user.
+#Optional query arguments: start, end, category, account to filter; limit and cursor to page
+#through the results; format=ndjson to stream one transaction per line.
 @app.route("/user_transactions", methods = ['GET'])
 @login_required
 def user_transactions():
     db = get_db()
-    data = get_user_transactions(db, current_user.username)
-    return jsonify(data)
+    args = request.args
+    try:
+        filters = {
+            "start": parse_time_arg(args.get("start")),
+            "end": parse_time_arg(args.get("end"), end=True),
+            "category": args.get("category"),
+            "accountno": args.get("account"),
+        }
+        after = decode_cursor(args["cursor"]) if args.get("cursor") else None
+        limit = int(args["limit"]) if args.get("limit") else None
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid query arguments"}), 400
+    if limit is not None and not 0 < limit <= 1000:
+        return jsonify({"error": "limit must be between 1 and 1000"}), 400
+
+    userid = current_user.id
+
+    if args.get("format") == "ndjson" or request.accept_mimetypes.best == "application/x-ndjson":
+        rows = iter_user_transactions(db, userid, after=after, limit=limit, **filters)
+        return Response(stream_with_context(json.dumps(row) + "\n" for row in rows), mimetype="application/x-ndjson")
+
+    if limit is None:
+        return jsonify(list(iter_user_transactions(db, userid, after=after, **filters)))
+
+    records, next_position = get_user_transactions_page(db, userid, limit=limit, after=after, **filters)
+    return jsonify(transactions=records, next_cursor=encode_cursor(next_position) if next_position else None)
 
-#Allows files to be uploaded from the web
+#Send aggregated spending for the current user over the days in [start, end): totals per category,
+#per day/week/month buckets and the change against the preceding period of the same length.
+#Defaults to the last 30 days bucketed by day. Read from the daily rollup, so times are truncated to days.
+@app.route("/spending/summary", methods = ['GET'])
+@login_required
+def spending_summary():
+    args = request.args
+    bucket = args.get("bucket", "day")
+    if bucket not in ("day", "week", "month"):
+        return jsonify({"error": "bucket must be day, week or month"}), 400
+    try:
+        end = datetime.strptime(parse_time_arg(args.get("end"), end=True), "%Y-%m-%d %H:%M:%S") if args.get("end") else datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        start = datetime.strptime(parse_time_arg(args.get("start")), "%Y-%m-%d %H:%M:%S") if args.get("start") else end - timedelta(days=30)
+    except ValueError:
+        return jsonify({"error": "Invalid query arguments"}), 400
+    if start >= end:
+        return jsonify({"error": "start must be before end"}), 400
+    previous_start = start - (end - start)
+
+    db = get_db()
+    userid = current_user.id
+    bounds = [value.strftime("%Y-%m-%d %H:%M:%S") for value in (previous_start, start, end)]
+    categories = get_spending_by_category(db, userid, *bounds)
+    buckets = get_spending_buckets(db, userid, bounds[1], bounds[2], bucket)
+
+    total = sum(row[1] for row in categories)
+    previous_total = sum(row[3] for row in categories)
+    return jsonify(
+        start=bounds[1],
+        end=bounds[2],
+        bucket=bucket,
+        total=total,
+        count=sum(row[2] for row in categories),
+        previous_total=previous_total,
+        change=total - previous_total,
+        change_pct=percent_change(total, previous_total),
+        categories=[{
+            "category": category,
+            "total": category_total,
+            "count": count,
+            "previous_total": category_previous,
+            "change_pct": percent_change(category_total, category_previous),
+        } for category, category_total, count, category_previous, _ in categories if count],
+        buckets=[{"period": period, "total": bucket_total, "count": count} for period, bucket_total, count in buckets],
+    )
+
+# Uploaded files wait here until a background worker has processed them
+UPLOAD_DIR = os.getenv("WHACK_UPLOAD_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_in"))
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+#Allows files to be uploaded from the web, either as multipart form data (field "file") or as
+#the raw request body with a text/csv or image/* content type. A raw body is read straight
+#from the socket; multipart uploads are spooled to a temporary file by the form parser first.
+#Csv statements are validated row by row while they are written to a uniquely named file, so
+#concurrent uploads never share a path, and rejected rows are reported with their line
+#numbers. Valid rows and receipt images are queued for a background worker (python jobs.py);
+#the response carries the row counts, timings and the job id to poll at /jobs/<id>.
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    if 'file' not in request.files:
-        return jsonify({"error": "No file part"}), 400
+    if request.mimetype == "text/csv" or request.mimetype.startswith("image/"):
+        stream, mimetype, filename = request.stream, request.mimetype, request.args.get("filename", "")
+    else:
+        if 'file' not in request.files:
+            return jsonify({"error": "No file part"}), 400
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({"error": "No selected file"}), 400
+        stream, mimetype, filename = file.stream, file.mimetype or "", file.filename
+
+    is_image = mimetype.startswith("image/")
+    extension = os.path.splitext(filename)[1].lower() or (".png" if is_image else ".csv")
+    path = unique_upload_path(UPLOAD_DIR, extension)
+    try:
+        if is_image:
+            stats = save_upload(stream, path)
+        else:
+            stats = receive_transaction_csv(stream, path)
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
 
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({"error": "No selected file"}), 400
+    if not is_image and not stats["rows"]:
+        return jsonify({"error": "No valid rows", **stats}), 400
 
-    # Save the file or process it as needed
-    file.save("backend\data_in\input_data.csv")
-    db = get_db()
-    add_file_transaction_data(db, "backend\data_in\input_data.csv")
-    
-    return jsonify({"message": "File uploaded successfully"}), 200
+    userid = current_user.id if current_user.is_authenticated else None
+    kind = "classify_receipt" if is_image else "ingest_transactions"
+    job_id = enqueue_job(get_write_db(), kind, {"path": path}, userid)
+    return jsonify({"message": "File uploaded successfully", "job_id": job_id, "status_url": f"/jobs/{job_id}", **stats}), 202
+
+# Requests over MAX_CONTENT_LENGTH are refused before they are read
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({"error": f"upload is larger than {UPLOAD_MAX_BYTES} bytes"}), 413
+
+#Reports the status, progress, timing and result of a background job
+@app.route("/jobs/<int:job_id>", methods=['GET'])
+def job_status(job_id):
+    job = get_job(get_db(), job_id)
+    if job is None or (job["userid"] is not None and not (current_user.is_authenticated and current_user.id == job["userid"])):
+        return jsonify({"error": "No such job"}), 404
+    return jsonify(job)
 
 @app.route("/chat", methods=['POST'])
 def chat():
-    db = get_db()
     data = request.json
     user_input = data.get("message", "")
     
     if not user_input:
         return jsonify({"error": "No message provided"}), 400
-    
+
+    # Signed in users get the facts about their accounts relevant to the message and their
+    # recent conversation as context. The write connection is only held for the database
+    # work, never while waiting on the model.
+    userid = None
+    history = []
+    if current_user.is_authenticated:
+        userid = current_user.id
+        history.append(build_financial_context(get_db(), userid, user_input))
+        with db_pool.writer() as db:
+            history += build_context(db, userid)
+            record_message(db, userid, "user", user_input)
+
+    # Stream the reply as server-sent events when asked to, one event per token
+    if data.get("stream") or request.accept_mimetypes.best == "text/event-stream":
+        return Response(chat_events(user_input, history, userid), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
     try:
-        # Assuming run_model is a function that processes the chat input
-        history = get_dialogue(db)
-        bot_response = run_model("chat", user_input)
-        print(f"MY response is:{bot_response}")
+        bot_response = run_model("chat", user_input, history)
+        save_reply(userid, bot_response)
         return jsonify({"response": bot_response})
+    except LLMBusyError as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Records the assistant's reply in the user's conversation
+def save_reply(userid, reply):
+    if userid is not None and reply:
+        with db_pool.writer() as db:
+            record_message(db, userid, "assistant", reply)
+
+# Server-sent events for a streamed chat reply: data events carrying {"token": ...}, then a
+# done event, or an error event if the completion fails part way
+def chat_events(user_input, history, userid):
+    pieces = []
+    try:
+        for token in stream_model("chat", user_input, history):
+            pieces.append(token)
+            yield f"data: {json.dumps({'token': token})}\n\n"
+        save_reply(userid, "".join(pieces))
+        yield "event: done\ndata: {}\n\n"
+    except Exception as e:
+        yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+# Hit-rate statistics for the LLM completion cache and the categorisation cache
+@app.route("/cache_stats", methods=['GET'])
+@login_required
+def cache_stats():
+    return jsonify(completions=get_completion_cache().stats(), categories=get_category_cache().stats(), users=get_user_cache().stats())
+
 '''Prototype method to send an email. Requires: 
 username - username of the user to send the email to
 subject - subject line of the email
@@ -193,19 +565,19 @@ def send_email(username, subject, template, date):
         email = user.email
         
         sender = "Nikita.Pelagecha@warwick.ac.uk"
-        message = Message(subject = subject, sender = ("NOREPLY", sender), recipients = email)
+        message = Message(subject = subject, sender = ("NOREPLY", sender), recipients = [email])
         
-        db = get_db()
-
-        expensethisweek=get_transactions_in_time(db, current_user.username, date, date - timedelta(weeks=1))
-        percentexpensemore=expensethisweek/(expensethisweek - get_transactions_in_time(db, current_user.username, date - timedelta(weeks=1), date - timedelta(weeks=2)))*100
-        expensethisweekcategory=get_expenses_per_category(db, current_user.username, date, date - timedelta(weeks=1))
-        expensethismonth=get_transactions_in_time(db, current_user.username, date - relativedelta(months=1), date)
-        percentexpensemoremonth=expensethismonth/(expensethismonth - get_transactions_in_time(db, current_user.username, date - relativedelta(months=1), date - relativedelta(months=2)))*100
-        expensethismonthcategory=get_expenses_per_category(db, current_user.username, date - relativedelta(months=1), date - relativedelta(months=2))
-        message.html = render_template('template.html', username=username, expensethisweek=expensethisweek, percentexpensemore=percentexpensemore, expensethisweekcategory=expensethisweekcategory, expensethismonth=expensethismonth, percentexpensemoremonth=percentexpensemoremonth, expensethismonthcategory=expensethismonthcategory)
+        # The same digest the batched send_digests job builds, for just this user; users
+        # without an email address get no digest
+        digests = collect_digests(db, date, userid=user.id)
+        if not digests:
+            return jsonify({"error": "No email on file"}), 400
+        message.html = render_digest(digests[0])
         
         mail.send(message)
+        return jsonify(success=True)
 
 if __name__ == '__main__':
+    if "--seed" in sys.argv:
+        initialise_db(seed=True)
     app.run(debug=True)
\ No newline at end of file
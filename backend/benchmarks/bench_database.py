@@ -0,0 +1,158 @@
+# Micro-benchmarks for the database layer at increasing scale.
+# For each scale, generates deterministic data (benchmarks.generate_data), loads it into a fresh
+# database, times the ingest and then each query helper over a fixed sample of users and
+# accounts. Results are written as JSON so runs can be compared; --compare prints the change
+# against an earlier results file.
+#
+#   cd backend/
+#   python -m benchmarks.bench_database --scales 10000 100000 1000000 --output bench_database.json
+#   python -m benchmarks.bench_database --scales 10000 100000 --compare bench_database.json
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks.generate_data import START, generate
+from database.database import (
+    add_file_account_data, add_file_transaction_data, add_file_user_data, create_connection, create_tables,
+    get_account_transactions, get_balance, get_category_transactions, get_expenses_per_category,
+    get_spending_buckets, get_spending_by_category, get_transactions_in_time, get_user_accounts,
+    get_user_transactions,
+)
+
+
+def summarise(samples):
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "min_ms": ordered[0] * 1000,
+        "median_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def time_calls(function, argument_sets):
+    samples = []
+    for args in argument_sets:
+        start = time.perf_counter()
+        function(*args)
+        samples.append(time.perf_counter() - start)
+    return summarise(samples)
+
+
+# The query helpers being measured, each with a function building its arguments from a
+# sampled (userid, accountno, rng)
+def query_cases():
+    month_start = START + timedelta(days=150)
+    month_end = START + timedelta(days=180)
+    day = date(month_start.year, month_start.month, month_start.day)
+    return {
+        "get_user_transactions": (get_user_transactions, lambda db, userid, accountno, rng: (db, userid)),
+        "get_user_accounts": (get_user_accounts, lambda db, userid, accountno, rng: (db, userid)),
+        "get_account_transactions": (get_account_transactions, lambda db, userid, accountno, rng: (db, accountno)),
+        "get_balance": (get_balance, lambda db, userid, accountno, rng: (db, accountno)),
+        "get_transactions_in_time": (get_transactions_in_time, lambda db, userid, accountno, rng: (db, accountno, month_start, month_end)),
+        "get_category_transactions": (get_category_transactions, lambda db, userid, accountno, rng: (db, accountno, rng.choice(["dining", "groceries", "rent"]))),
+        "get_expenses_per_category": (get_expenses_per_category, lambda db, userid, accountno, rng: (db, accountno)),
+        "get_spending_by_category": (get_spending_by_category, lambda db, userid, accountno, rng: (db, userid, (day - timedelta(days=60)).isoformat(), (day - timedelta(days=30)).isoformat(), day.isoformat())),
+        "get_spending_buckets": (get_spending_buckets, lambda db, userid, accountno, rng: (db, userid, START.date().isoformat(), (START + timedelta(days=365)).date().isoformat(), "month")),
+    }
+
+
+def bench_scale(scale, samples, seed, keep):
+    workdir = tempfile.mkdtemp(prefix=f"whack-bench-db-{scale}-")
+    try:
+        start = time.perf_counter()
+        files = generate(os.path.join(workdir, "data"), scale, seed=seed)
+        generate_seconds = time.perf_counter() - start
+
+        db = create_connection(os.path.join(workdir, "finance.db"))
+        create_tables(db)
+        add_file_user_data(db, files["users"][0])
+        add_file_account_data(db, files["accounts"][0])
+        ingest = add_file_transaction_data(db, files["transactions"][0])
+
+        rng = random.Random(seed)
+        users, accounts = files["users"][1], files["accounts"][1]
+        userids = [rng.randint(1, users) for _ in range(samples)]
+        accountnos = [db.execute('SELECT accountno FROM accounts WHERE rowid = ?;', (rng.randint(1, accounts),)).fetchone()[0] for _ in range(samples)]
+
+        queries = {}
+        for name, (function, arguments) in query_cases().items():
+            argument_sets = [arguments(db, userid, accountno, rng) for userid, accountno in zip(userids, accountnos)]
+            function(*argument_sets[0])
+            queries[name] = time_calls(function, argument_sets)
+        db.close()
+
+        return {
+            "scale": scale,
+            "users": users,
+            "accounts": accounts,
+            "generate_seconds": generate_seconds,
+            "database_bytes": os.path.getsize(os.path.join(workdir, "finance.db")),
+            "ingest": ingest,
+            "queries": queries,
+        }
+    finally:
+        if keep:
+            print(f"kept {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_results(results, previous=None):
+    baseline = {result["scale"]: result for result in (previous or {}).get("results", [])}
+    for result in results:
+        print(f"\n{result['scale']} transactions, {result['users']} users, {result['accounts']} accounts")
+        ingest = result["ingest"]
+        print(f"  {'ingest':<28}{ingest['seconds'] * 1000:10.1f} ms  ({ingest['rows_per_sec']:,.0f} rows/s)")
+        before = baseline.get(result["scale"], {}).get("queries", {})
+        for name, timing in result["queries"].items():
+            change = ""
+            if name in before and before[name]["median_ms"] > 0:
+                change = f"  {(timing['median_ms'] / before[name]['median_ms'] - 1) * 100:+6.1f}%"
+            print(f"  {name:<28}{timing['median_ms']:10.3f} ms median  {timing['p95_ms']:10.3f} ms p95{change}")
+
+
+def run(scales, samples, seed, output, compare, keep):
+    results = [bench_scale(scale, samples, seed, keep) for scale in scales]
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": seed,
+            "samples": samples,
+        },
+        "results": results,
+    }
+    previous = None
+    if compare:
+        with open(compare) as file1:
+            previous = json.load(file1)
+    print_results(results, previous)
+    if output:
+        with open(output, "w") as file1:
+            json.dump(report, file1, indent=2)
+        print(f"\nwrote {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Database layer benchmarks at several scales")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10000, 100000, 1000000], help="transaction rows per run")
+    parser.add_argument("--samples", type=int, default=50, help="calls timed per query helper and scale")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_database.json")
+    parser.add_argument("--compare", help="earlier results file to compare medians against")
+    parser.add_argument("--keep", action="store_true", help="keep the generated data and database")
+    args = parser.parse_args()
+    run(args.scales, args.samples, args.seed, args.output, args.compare, args.keep)
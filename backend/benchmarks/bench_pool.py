@@ -0,0 +1,113 @@
+# Concurrency benchmark for the pooled database connections.
+# Runs reader threads hammering /user_transactions while writer threads post csv files to
+# /upload, against a scratch copy of the sample database, and reports throughput and
+# latency percentiles for each side. /upload only queues an ingest job, so each writer runs
+# the job itself straight after, on the app's pooled write connection; a write is timed from
+# the upload until its rows are committed.
+#
+#   cd backend/
+#   python -m benchmarks.bench_pool --readers 8 --writers 1 --seconds 10
+import argparse
+import itertools
+import os
+import statistics
+import tempfile
+import threading
+import time
+from io import BytesIO
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def login(client, username):
+    with client.session_transaction() as session:
+        session["_user_id"] = username
+        session["_fresh"] = True
+
+
+def run(readers, writers, seconds, upload_rows):
+    scratch = tempfile.mkdtemp(prefix="whack-bench-")
+    os.environ["WHACK_DATABASE"] = os.path.join(scratch, "finance.db")
+    os.environ["WHACK_SEED_DB"] = "1"
+    os.environ["WHACK_UPLOAD_DIR"] = os.path.join(scratch, "uploads")
+
+    from app import app, db_pool
+    from jobs import get_job, run_next_job
+
+    with open(os.path.join("sample", "sample_transaction_data.csv"), "rb") as sample:
+        lines = [line for line in sample.read().splitlines() if line.startswith(b"ACC00002")]
+    uploads = itertools.count()
+
+    # Every upload gets its own references, so the ingest dedupe never skips it
+    def upload_body():
+        number = next(uploads)
+        return b"\n".join(lines[i % len(lines)] + f" {number}".encode() for i in range(upload_rows)) + b"\n"
+
+    deadline = time.perf_counter() + seconds
+    latencies = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    lock = threading.Lock()
+
+    def reader():
+        client = app.test_client()
+        login(client, "user1")
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = client.get("/user_transactions")
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies["read"].append(elapsed)
+                errors["read"] += response.status_code != 200
+
+    def writer():
+        client = app.test_client()
+        login(client, "user1")
+        while time.perf_counter() < deadline:
+            body = upload_body()
+            start = time.perf_counter()
+            response = client.post("/upload", data={"file": (BytesIO(body), "bench.csv")}, content_type="multipart/form-data")
+            failed = response.status_code >= 300
+            if not failed:
+                job_id = response.get_json()["job_id"]
+                with db_pool.writer() as db:
+                    # Another writer may have run this job already, or queued one before it
+                    while get_job(db, job_id)["status"] == "queued" and run_next_job(db, "bench"):
+                        pass
+                    failed = get_job(db, job_id)["status"] != "done"
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies["write"].append(elapsed)
+                errors["write"] += failed
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"{readers} readers, {writers} writers, {seconds}s, {upload_rows} rows per upload")
+    for kind, samples in latencies.items():
+        if not samples:
+            continue
+        print(f"  {kind:5} {len(samples) / seconds:8.1f} req/s  "
+              f"mean {statistics.mean(samples) * 1000:7.2f} ms  "
+              f"p50 {percentile(samples, 50) * 1000:7.2f} ms  "
+              f"p95 {percentile(samples, 95) * 1000:7.2f} ms  "
+              f"p99 {percentile(samples, 99) * 1000:7.2f} ms  "
+              f"errors {errors[kind]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mixed read/write benchmark for the database connection pool")
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=1)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--upload-rows", type=int, default=200)
+    args = parser.parse_args()
+    run(args.readers, args.writers, args.seconds, args.upload_rows)
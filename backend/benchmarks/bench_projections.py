@@ -0,0 +1,55 @@
+# Benchmark for the vectorised balance projections.
+# Projects randomly generated accounts over monthly horizons, once with NumPy and once with the
+# per-account Python loop the projections replace, and sums the results per user.
+#
+#   cd backend/
+#   python -m benchmarks.bench_projections --accounts 100000 --months 60
+import argparse
+import time
+
+import numpy as np
+
+from projections import horizons, project_balances, totals_by_user
+
+
+def python_projection(balances, rates, months):
+    return [[balance * (1 + rate / 1200) ** month for month in months] for balance, rate in zip(balances, rates)]
+
+
+def run(accounts, months, users, repeat, loop_accounts):
+    rng = np.random.default_rng(0)
+    balances = rng.uniform(0, 50000, accounts)
+    rates = rng.uniform(0, 5, accounts)
+    userids = np.sort(rng.integers(1, users + 1, accounts))
+    points = horizons(months)
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        projected = project_balances(balances, rates, points)
+        best = min(best, time.perf_counter() - start)
+    print(f"numpy:  {accounts} accounts x {len(points)} horizons in {best * 1000:.1f} ms "
+          f"({accounts * len(points) / best / 1e6:.1f}M balances/s)")
+
+    start = time.perf_counter()
+    totals_by_user(userids, projected)
+    print(f"totals: {users} users in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    sample = min(loop_accounts, accounts)
+    start = time.perf_counter()
+    looped = python_projection(balances[:sample], rates[:sample], points)
+    elapsed = (time.perf_counter() - start) * accounts / sample
+    print(f"python: {elapsed * 1000:.1f} ms for {accounts} accounts (extrapolated from {sample}), "
+          f"{elapsed / best:.0f}x slower")
+    assert np.allclose(looped, projected[:sample])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vectorised balance projection benchmark")
+    parser.add_argument("--accounts", type=int, default=100000)
+    parser.add_argument("--months", type=int, default=60)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--loop-accounts", type=int, default=10000, help="accounts timed with the Python loop")
+    args = parser.parse_args()
+    run(args.accounts, args.months, args.users, args.repeat, args.loop_accounts)
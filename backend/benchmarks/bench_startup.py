@@ -0,0 +1,66 @@
+# Start-up benchmark for the web process.
+# Imports app in a fresh interpreter, against a scratch database, and reports the import time,
+# the resident memory afterwards and which heavy ML modules were loaded. The "eager" run first
+# imports the ML stack the way app used to (through utils), for comparison with the default
+# lazy start-up.
+#
+#   cd backend/
+#   python -m benchmarks.bench_startup --runs 3
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HEAVY_MODULES = ["torch", "transformers", "easyocr", "PIL", "pytesseract", "openai", "httpx", "numpy"]
+
+# Run in the child interpreter; prints a JSON report on its last line
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+for name in sys.argv[1].split(","):
+    if name:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+import app
+seconds = time.perf_counter() - start
+with open("/proc/self/status") as status:
+    rss = next(int(line.split()[1]) for line in status if line.startswith("VmRSS:"))
+print(json.dumps({"seconds": seconds, "rss_mb": rss / 1024, "loaded": [name for name in sys.argv[2].split(",") if name in sys.modules]}))
+'''
+
+
+def measure(preload, runs):
+    env = dict(os.environ, WHACK_DATABASE=os.path.join(tempfile.mkdtemp(prefix="whack-startup-"), "finance.db"))
+    reports = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE, ",".join(preload), ",".join(HEAVY_MODULES)],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        reports.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "seconds": statistics.median(report["seconds"] for report in reports),
+        "rss_mb": statistics.median(report["rss_mb"] for report in reports),
+        "loaded": reports[-1]["loaded"],
+    }
+
+
+def run(runs):
+    eager = measure(["classifier", "read_receipt", "ocr", "gpt", "torch", "transformers", "easyocr", "PIL", "pytesseract", "openai", "httpx", "numpy"], runs)
+    lazy = measure([], runs)
+    for name, result in (("eager", eager), ("lazy", lazy)):
+        print(f"{name:>5}: import app in {result['seconds'] * 1000:.0f} ms, RSS {result['rss_mb']:.0f} MB, "
+              f"heavy modules loaded: {', '.join(result['loaded']) or 'none'}")
+    print(f"saved: {(eager['seconds'] - lazy['seconds']) * 1000:.0f} ms and {eager['rss_mb'] - lazy['rss_mb']:.0f} MB per web process")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Web process start-up time and memory benchmark")
+    parser.add_argument("--runs", type=int, default=3, help="interpreters started per configuration; the median is reported")
+    args = parser.parse_args()
+    run(args.runs)
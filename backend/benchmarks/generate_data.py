@@ -0,0 +1,87 @@
+# Deterministic synthetic data in the sample csv formats.
+# Writes users.csv, accounts.csv and transactions.csv that the loaders in database.py accept,
+# at any scale. The same arguments always produce byte-identical files.
+#
+#   cd backend/
+#   python -m benchmarks.generate_data --transactions 1000000 --out /tmp/whack-1m
+import argparse
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+
+# Password hash shared by every generated user: the sample users' hash of "password", so
+# generating users does not pay for scrypt
+PASSWORD_HASH = "scrypt:32768:8:1$qtT0UuElSBBwY1qh$8ec5230096e7834c7730b03e236c4dc614c3907a366f02dedeb05e12e55135371a377f187a2ec83c1e39a66abf33fc210d5952a500fc3adc62b6e4d74e1f5f61"
+
+ACCOUNT_TYPES = ["current", "savings", "ISA", "business"]
+ACCOUNT_REFERENCES = ["Family Savings", "High-Yield Savings", "Travel Fund", "Business Premium", "Standard Account"]
+# Categories and the references that appear under them, as in the sample transactions
+CATEGORY_REFS = {
+    "dining": ["restaurant", "fast food", "coffee", "snacks"],
+    "entertainment": ["movie", "concert", "museum", "sports event"],
+    "groceries": ["bread", "milk", "meat", "fruits", "vegetables", "snacks"],
+    "rent": ["monthly rent"],
+    "transport": ["fuel", "bus fare", "train ticket"],
+    "utilities": ["electricity", "gas", "water", "internet", "phone bill"],
+}
+START = datetime(2023, 1, 1)
+DAYS = 365
+
+
+def account_number(index):
+    return f"ACC{index:05d}"
+
+
+# Users default to one per 1,000 transactions, with 1 to 5 accounts each
+def default_users(transactions):
+    return max(10, transactions // 1000)
+
+
+# Writes the three csv files into <out> and returns {name: (path, rows)}
+def generate(out, transactions, users=None, seed=0):
+    users = users or default_users(transactions)
+    rng = random.Random(seed)
+    os.makedirs(out, exist_ok=True)
+    paths = {name: os.path.join(out, f"{name}.csv") for name in ("users", "accounts", "transactions")}
+
+    with open(paths["users"], "w", newline="") as file1:
+        writer = csv.writer(file1, lineterminator="\n")
+        for i in range(1, users + 1):
+            writer.writerow([f"user{i}", f"user{i}@email.com", PASSWORD_HASH])
+
+    accounts = []
+    with open(paths["accounts"], "w", newline="") as file1:
+        writer = csv.writer(file1, lineterminator="\n")
+        for userid in range(1, users + 1):
+            for _ in range(rng.randint(1, 5)):
+                accountno = account_number(len(accounts) + 1)
+                accounts.append(accountno)
+                writer.writerow([
+                    accountno, userid, f"{rng.uniform(0, 20000):.2f}", rng.choice(ACCOUNT_TYPES),
+                    f"{rng.uniform(0.5, 5):.2f}", rng.choice(ACCOUNT_REFERENCES),
+                ])
+
+    categories = list(CATEGORY_REFS)
+    with open(paths["transactions"], "w", newline="") as file1:
+        writer = csv.writer(file1, lineterminator="\n")
+        for _ in range(transactions):
+            category = rng.choice(categories)
+            time = START + timedelta(minutes=rng.randrange(DAYS * 24 * 60))
+            writer.writerow([
+                rng.choice(accounts), time.strftime("%Y-%m-%d"), time.strftime("%H:%M"), category,
+                f"{rng.uniform(-500, 500):.2f}", rng.choice(CATEGORY_REFS[category]),
+            ])
+
+    return {"users": (paths["users"], users), "accounts": (paths["accounts"], len(accounts)), "transactions": (paths["transactions"], transactions)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic users, accounts and transactions")
+    parser.add_argument("--transactions", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=None, help="defaults to one user per 1,000 transactions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="generated")
+    args = parser.parse_args()
+    for name, (path, rows) in generate(args.out, args.transactions, args.users, args.seed).items():
+        print(f"{name}: {rows} rows in {path}")
@@ -0,0 +1,291 @@
+# End-to-end load test for the Flask API.
+# Serves app.py over HTTP against a scratch database filled with generated data, with the
+# OpenAI API, the classifier and OCR replaced by local stubs of configurable latency, and
+# background job workers running in-process. Virtual users log in and then send a weighted
+# mix of /user_transactions, /user_accounts, /upload (statements and receipts), /chat and
+# further logins. Each concurrency level runs for a fixed time and reports throughput,
+# p50/p95/p99 latency and error rate per endpoint.
+#
+#   cd backend/
+#   python -m benchmarks.load_test --concurrency 1 4 16 --seconds 20 --llm-latency 0.5
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from http.cookiejar import CookieJar
+
+from benchmarks.bench_pool import percentile
+from benchmarks.generate_data import generate
+
+PASSWORD = "loadtest"
+DEFAULT_MIX = {"user_transactions": 40, "user_accounts": 20, "chat": 15, "upload": 10, "receipt": 5, "login": 5}
+QUESTIONS = ["How much did I spend on dining?", "What was my biggest expense last month?", "Am I spending more on groceries?", "Where does my rent go?"]
+
+
+# Zero-shot classifier stand-in: waits <latency> seconds per batch and picks the first label
+class StubClassifier:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def classify_many(self, descriptions, candidate_labels):
+        time.sleep(self.latency)
+        probabilities = {label: 1 / len(candidate_labels) for label in candidate_labels}
+        return [(candidate_labels[0], probabilities) for _ in descriptions]
+
+
+# OCR stand-in: waits <latency> seconds and returns text unique to the image
+class StubOCRService:
+    engine = "stub"
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def read_text(self, source):
+        time.sleep(self.latency)
+        return f"Receipt {os.path.basename(str(source))}\nTotal 12.34"
+
+
+# Sets up the scratch database, the stubs, the job workers and the HTTP server. Returns the
+# base url, the database path, (username, account numbers) for each user and a stop function.
+def start_stack(workdir, transactions, users, llm_latency, token_delay, classifier_latency, ocr_latency, workers):
+    from stub_openai import start_stub_server
+
+    stub = start_stub_server(latency=llm_latency, token_delay=token_delay)
+    database_path = os.path.join(workdir, "finance.db")
+    os.environ.update({
+        "WHACK_DATABASE": database_path,
+        "OPENAI_BASE_URL": stub.base_url,
+        "OPENAI_API_KEY": "stub",
+        "WHACK_UPLOAD_DIR": os.path.join(workdir, "uploads"),
+    })
+    # Every virtual user connects from 127.0.0.1, so the per-address login limit is lifted
+    os.environ.setdefault("LOGIN_ATTEMPTS_PER_IP", "1000000000")
+
+    from database.database import add_file_account_data, add_file_transaction_data, add_file_user_data, create_connection, create_tables
+    from werkzeug import security
+
+    files = generate(os.path.join(workdir, "data"), transactions, users)
+    db = create_connection(database_path)
+    create_tables(db)
+    add_file_user_data(db, files["users"][0])
+    add_file_account_data(db, files["accounts"][0])
+    add_file_transaction_data(db, files["transactions"][0])
+    db.execute('UPDATE users SET password = ?;', (security.generate_password_hash(PASSWORD),))
+    db.commit()
+    accounts = defaultdict(list)
+    for accountno, userid in db.execute('SELECT accountno, userid FROM accounts;'):
+        accounts[userid].append(accountno)
+    usernames = {userid: username for userid, username in db.execute('SELECT id, username FROM users;')}
+    db.close()
+
+    import category_cache
+    import classifier
+    import llm_cache
+    import ocr
+    category_cache._cache = category_cache.CategoryCache(path=os.path.join(workdir, "category_cache.db"))
+    llm_cache._cache = llm_cache.CompletionCache(path=os.path.join(workdir, "llm_cache.db"))
+    classifier._classifier = StubClassifier(classifier_latency)
+    ocr._service = StubOCRService(ocr_latency)
+
+    from app import app
+    from jobs import worker_loop
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stop_workers = threading.Event()
+    worker_threads = [
+        threading.Thread(target=worker_loop, args=(database_path, stop_workers, 0.05), daemon=True)
+        for _ in range(workers)
+    ]
+    for thread in worker_threads:
+        thread.start()
+
+    def stop():
+        stop_workers.set()
+        for thread in worker_threads:
+            thread.join()
+        server.shutdown()
+        stub.shutdown()
+
+    virtual_users = [(usernames[userid], accountnos) for userid, accountnos in sorted(accounts.items()) if userid in usernames]
+    return f"http://127.0.0.1:{server.server_port}", database_path, virtual_users, stop
+
+
+# One simulated user with its own cookie session
+class VirtualUser:
+    def __init__(self, base_url, username, accountnos, rng, upload_rows):
+        self.base_url = base_url
+        self.username = username
+        self.accountnos = accountnos
+        self.rng = rng
+        self.upload_rows = upload_rows
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def request(self, path, body=None, content_type=None):
+        headers = {"Content-Type": content_type} if content_type else {}
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method="POST" if body is not None else "GET")
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def login(self):
+        return self.request("/login", json.dumps({"username": self.username, "password": PASSWORD}).encode(), "application/json")
+
+    def user_transactions(self):
+        return self.request("/user_transactions?limit=100")
+
+    def user_accounts(self):
+        return self.request("/user_accounts")
+
+    def chat(self):
+        message = f"{self.rng.choice(QUESTIONS)} ({self.rng.random():.6f})"
+        return self.request("/chat", json.dumps({"message": message}).encode(), "application/json")
+
+    # A small statement of new transactions on this user's accounts
+    def upload(self):
+        rows = []
+        for _ in range(self.upload_rows):
+            day = self.rng.randrange(1, 29)
+            rows.append(f"{self.rng.choice(self.accountnos)},2024-{self.rng.randrange(1, 13):02d}-{day:02d},"
+                        f"{self.rng.randrange(24):02d}:{self.rng.randrange(60):02d},dining,{self.rng.uniform(-100, 100):.2f},load test")
+        return self.request("/upload?filename=statement.csv", ("\n".join(rows) + "\n").encode(), "text/csv")
+
+    def receipt(self):
+        return self.request("/upload?filename=receipt.png", os.urandom(2048), "image/png")
+
+
+def run_level(base_url, users, concurrency, seconds, mix, upload_rows, seed):
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+    actions, weights = zip(*mix.items())
+
+    def record(action, function):
+        start = time.perf_counter()
+        try:
+            status = function()
+        except Exception:
+            status = None
+        elapsed = time.perf_counter() - start
+        with lock:
+            samples[action].append(elapsed)
+            if status is None or status >= 400:
+                errors[action] += 1
+
+    def virtual_user(index):
+        rng = random.Random(seed * 1000 + index)
+        username, accountnos = users[index % len(users)]
+        user = VirtualUser(base_url, username, accountnos, rng, upload_rows)
+        record("login", user.login)
+        while time.perf_counter() < deadline:
+            action = rng.choices(actions, weights)[0]
+            record(action, getattr(user, action))
+
+    threads = [threading.Thread(target=virtual_user, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for action in sorted(samples):
+        latencies = samples[action]
+        results[action] = {
+            "requests": len(latencies),
+            "throughput_rps": len(latencies) / elapsed,
+            "error_rate": errors[action] / len(latencies),
+            "mean_ms": statistics.mean(latencies) * 1000,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+        }
+    total = sum(len(latencies) for latencies in samples.values())
+    return {"concurrency": concurrency, "seconds": elapsed, "throughput_rps": total / elapsed, "endpoints": results}
+
+
+def job_counts(database_path):
+    from database.database import create_connection
+
+    db = create_connection(database_path)
+    try:
+        return dict(db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status;').fetchall())
+    finally:
+        db.close()
+
+
+def print_level(level):
+    print(f"\nconcurrency {level['concurrency']}: {level['throughput_rps']:.1f} requests/s over {level['seconds']:.1f}s")
+    for action, result in level["endpoints"].items():
+        print(f"  {action:<18} {result['requests']:6d} req  {result['throughput_rps']:7.1f}/s  "
+              f"p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms  "
+              f"errors {result['error_rate'] * 100:5.1f}%")
+    if level.get("jobs"):
+        print(f"  jobs: {', '.join(f'{status} {count}' for status, count in sorted(level['jobs'].items()))}")
+
+
+def run(args):
+    mix = dict(DEFAULT_MIX)
+    for item in args.mix or []:
+        action, weight = item.split("=")
+        if action not in mix:
+            raise SystemExit(f"unknown action {action}, expected one of {', '.join(mix)}")
+        mix[action] = float(weight)
+    mix = {action: weight for action, weight in mix.items() if weight > 0}
+
+    workdir = tempfile.mkdtemp(prefix="whack-load-")
+    try:
+        base_url, database_path, users, stop = start_stack(
+            workdir, args.transactions, args.users, args.llm_latency, args.token_delay,
+            args.classifier_latency, args.ocr_latency, args.workers,
+        )
+        levels = []
+        try:
+            for concurrency in args.concurrency:
+                level = run_level(base_url, users, concurrency, args.seconds, mix, args.upload_rows, args.seed)
+                level["jobs"] = job_counts(database_path)
+                print_level(level)
+                levels.append(level)
+        finally:
+            stop()
+        if args.output:
+            with open(args.output, "w") as file1:
+                json.dump({"config": vars(args), "levels": levels}, file1, indent=2)
+            print(f"\nwrote {args.output}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mixed-traffic load test of the Flask API with stubbed models")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32], help="virtual users per level")
+    parser.add_argument("--seconds", type=float, default=15, help="duration of each level")
+    parser.add_argument("--transactions", type=int, default=20000, help="generated transactions in the scratch database")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds the stub OpenAI API takes per completion")
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    parser.add_argument("--classifier-latency", type=float, default=0.05)
+    parser.add_argument("--ocr-latency", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, default=1, help="in-process background job workers")
+    parser.add_argument("--upload-rows", type=int, default=50)
+    parser.add_argument("--mix", nargs="*", help="traffic weights, e.g. chat=30 upload=0")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    run(parser.parse_args())
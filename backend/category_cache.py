@@ -0,0 +1,168 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'category_cache.db')
+DEFAULT_MAX_ENTRIES = 10000
+
+
+# Lower-cases a transaction reference and collapses punctuation and whitespace so that
+# "Fast food", "fast  food" and "FAST-FOOD" share one cache entry
+def normalise_ref(text):
+    return " ".join(re.sub(r'[^a-z0-9&]+', ' ', str(text).lower()).split())
+
+
+# Order-insensitive fingerprint of a candidate label list
+def labels_key(candidate_labels):
+    joined = "\x1f".join(sorted(candidate_labels))
+    return hashlib.sha1(joined.encode('utf-8')).hexdigest()
+
+
+# Two-tier memoization of classifier results: an in-memory LRU in front of a SQLite table
+# stored next to finance.db. Entries are keyed on the normalised reference plus the label
+# set, and switching to a different label set drops everything cached for the old one.
+class CategoryCache:
+    def __init__(self, path=CACHE_FILE, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._memory = OrderedDict()
+        self._labels_key = None
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS categories (
+                    labels_key TEXT NOT NULL,
+                    ref TEXT NOT NULL,
+                    label TEXT NOT NULL,
+                    probabilities TEXT NOT NULL,
+                    PRIMARY KEY (labels_key, ref)
+                );
+            ''')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            ''')
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    '''Makes <key> the active label set, purging entries cached for any other label list'''
+    def _use_labels(self, key):
+        if key == self._labels_key:
+            return
+        connection = self._connect()
+        row = connection.execute("SELECT value FROM meta WHERE key = 'labels_key';").fetchone()
+        if row is None or row[0] != key:
+            connection.execute('DELETE FROM categories WHERE labels_key != ?;', (key,))
+            connection.execute('''
+                INSERT OR REPLACE INTO meta (key, value)
+                VALUES ('labels_key', ?);
+            ''', (key,))
+            connection.commit()
+        self._memory.clear()
+        self._labels_key = key
+
+    def _remember(self, memory_key, value):
+        self._memory[memory_key] = value
+        self._memory.move_to_end(memory_key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    '''Returns {normalised_ref: (label, probabilities)} for every ref already cached under these labels'''
+    def get_many(self, refs, candidate_labels):
+        key = labels_key(candidate_labels)
+        found = {}
+        with self._lock:
+            self._use_labels(key)
+            missing = []
+            for ref in set(normalise_ref(ref) for ref in refs):
+                value = self._memory.get(ref)
+                if value is None:
+                    missing.append(ref)
+                else:
+                    self._memory.move_to_end(ref)
+                    found[ref] = value
+
+            if missing:
+                connection = self._connect()
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = connection.execute(f'''
+                        SELECT ref, label, probabilities
+                        FROM categories
+                        WHERE labels_key = ? AND ref IN ({", ".join("?" * len(chunk))});
+                    ''', (key, *chunk)).fetchall()
+                    for ref, label, probabilities in rows:
+                        value = (label, json.loads(probabilities))
+                        self._remember(ref, value)
+                        found[ref] = value
+                        self.disk_hits += 1
+
+            for ref in refs:
+                if normalise_ref(ref) in found:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        return found
+
+    '''Stores freshly classified results, given as {ref: (label, probabilities)}'''
+    def put_many(self, results, candidate_labels):
+        key = labels_key(candidate_labels)
+        with self._lock:
+            self._use_labels(key)
+            rows = []
+            for ref, (label, probabilities) in results.items():
+                ref = normalise_ref(ref)
+                self._remember(ref, (label, probabilities))
+                rows.append((key, ref, label, json.dumps(probabilities)))
+            connection = self._connect()
+            connection.executemany('''
+                INSERT OR REPLACE INTO categories (labels_key, ref, label, probabilities)
+                VALUES (?, ?, ?, ?);
+            ''', rows)
+            connection.commit()
+
+    '''Empties both tiers'''
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            connection = self._connect()
+            connection.execute('DELETE FROM categories;')
+            connection.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Returns the process-wide categorisation cache
+def get_category_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CategoryCache()
+    return _cache
@@ -0,0 +1,76 @@
+from database import add_message, iter_recent_messages, get_messages_between, get_conversation_summary, set_conversation_summary
+import os
+import re
+
+# Token budget for the history sent with each chat request, and for the rolling summary within it
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", 1500))
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", 300))
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+# Longest excerpt of a single message kept in the summary, in characters
+SUMMARY_EXCERPT_CHARS = 160
+
+
+# Rough token count for English text, about four characters per token
+def estimate_tokens(text):
+    return max(1, (len(text) + 3) // 4)
+
+
+# Extractive summariser: appends the first sentence of each dropped message to the previous
+# summary and keeps only the most recent part that fits in <max_tokens>
+def summarise(previous, dropped, max_tokens=CHAT_SUMMARY_TOKENS):
+    lines = [previous] if previous else []
+    for _, role, content, _ in dropped:
+        sentence = re.split(r'(?<=[.!?])\s', " ".join(content.split()), maxsplit=1)[0]
+        if len(sentence) > SUMMARY_EXCERPT_CHARS:
+            sentence = sentence[:SUMMARY_EXCERPT_CHARS - 3] + "..."
+        lines.append(f"{role}: {sentence}")
+    summary = "\n".join(lines)
+    max_chars = max_tokens * 4
+    if len(summary) > max_chars:
+        summary = summary[-max_chars:].split("\n", 1)[-1]
+    return summary
+
+
+# Stores one message of a user's conversation
+def record_message(connection, userid, role, content):
+    return add_message(connection, userid, role, content, estimate_tokens(content))
+
+
+# Returns the chat history to send with a user's next message: the rolling summary of older
+# turns as a system message, followed by as many of the most recent turns as fit the budget.
+# <summariser>(previous_summary, dropped_rows, max_tokens) can be swapped for an LLM summary.
+# Turns that have just fallen out of the window are folded into the summary, so the request
+# size stays flat however long the conversation gets.
+def build_context(connection, userid, budget=CHAT_CONTEXT_TOKENS, summariser=summarise):
+    stored = get_conversation_summary(connection, userid)
+    summary, upto_turn, _ = stored if stored else ("", 0, 0)
+
+    # Part of the budget is always held back for the summary
+    summary_budget = min(CHAT_SUMMARY_TOKENS, budget // 2)
+    remaining = budget - summary_budget
+    recent = []
+    newest_turn = None
+    rows = iter_recent_messages(connection, userid, after_turn=upto_turn)
+    try:
+        for turn, role, content, tokens in rows:
+            newest_turn = newest_turn or turn
+            if tokens > remaining:
+                break
+            recent.append((turn, role, content))
+            remaining -= tokens
+    finally:
+        rows.close()
+    recent.reverse()
+
+    fold_before = recent[0][0] if recent else (newest_turn + 1 if newest_turn else None)
+    dropped = get_messages_between(connection, userid, upto_turn, fold_before) if fold_before else []
+    if dropped:
+        summary = summariser(summary, dropped, summary_budget - estimate_tokens(SUMMARY_PREFIX))
+        upto_turn = dropped[-1][0]
+        set_conversation_summary(connection, userid, summary, upto_turn, estimate_tokens(summary))
+
+    messages = []
+    if summary:
+        messages.append({"role": "system", "content": SUMMARY_PREFIX + summary})
+    messages.extend({"role": role, "content": content} for _, role, content in recent)
+    return messages
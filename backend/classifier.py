@@ -1,37 +1,131 @@
 # from transformers import pipeline
-from transformers import AutoModelForSequenceClassification, AutoTokenizer
-import torch
+from category_cache import get_category_cache, normalise_ref
+from metrics import MODEL_LOAD_SECONDS, time_inference
+import os
+import threading
 
+# transformers and torch take seconds and hundreds of MB to import, so they are only
+# imported when the model is first needed, not when the web process starts
 
-# Takes in item and categories, and outputs most likely category
-def classify_item(item_description, candidate_labels):
-    model_name = 'facebook/bart-large-mnli'
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+MODEL_NAME = 'facebook/bart-large-mnli'
+DEFAULT_BATCH_SIZE = int(os.getenv('CLASSIFIER_BATCH_SIZE', 32))
+
+
+# Long-lived zero-shot classifier. The tokenizer and model are loaded on first use and
+# shared by every caller in the process, and all premise/hypothesis pairs are scored in
+# padded batches rather than one forward pass per label.
+class ZeroShotClassifier:
+    def __init__(self, model_name=MODEL_NAME, batch_size=DEFAULT_BATCH_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._tokenizer = None
+        self._model = None
+        self._entailment_id = 2
+        self._lock = threading.Lock()
+
+    '''Loads the tokenizer and model once, guarded so concurrent first calls only load it once'''
+    def load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    with MODEL_LOAD_SECONDS.time(model="classifier"):
+                        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+                        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                        model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
+                        model.eval()
+                    label2id = {label.lower(): i for label, i in model.config.label2id.items()}
+                    self._entailment_id = label2id.get('entailment', 2)
+                    self._tokenizer = tokenizer
+                    self._model = model
+        return self._tokenizer, self._model
+
+    '''Returns the entailment probability for each (premise, hypothesis) pair'''
+    def score_pairs(self, pairs):
+        import torch
+        tokenizer, model = self.load()
+        scores = []
+        with torch.inference_mode(), time_inference("classifier"):
+            for start in range(0, len(pairs), self.batch_size):
+                batch = pairs[start:start + self.batch_size]
+                inputs = tokenizer(
+                    [premise for premise, _ in batch],
+                    [hypothesis for _, hypothesis in batch],
+                    return_tensors='pt',
+                    padding=True,
+                    truncation=True,
+                )
+                logits = model(**inputs).logits
+                probabilities = logits.softmax(dim=1)[:, self._entailment_id]
+                scores.extend(probabilities.tolist())
+        return scores
+
+    '''Classifies every description against the labels, returning (best_label, {label: probability}) per description'''
+    def classify_many(self, descriptions, candidate_labels):
+        candidate_labels = list(candidate_labels)
+        if not descriptions or not candidate_labels:
+            return [(None, {}) for _ in descriptions]
+
+        hypotheses = [f'This example is {label}.' for label in candidate_labels]
+        pairs = [(description, hypothesis) for description in descriptions for hypothesis in hypotheses]
+        scores = self.score_pairs(pairs)
+
+        results = []
+        n = len(candidate_labels)
+        for i in range(len(descriptions)):
+            probabilities = dict(zip(candidate_labels, scores[i * n:(i + 1) * n]))
+            best_label = max(probabilities, key=probabilities.get)
+            results.append((best_label, probabilities))
+        return results
 
-    results = {}
 
-    for label in candidate_labels:
-        premise = item_description
-        hypothesis = f'This example is {label}.'
+_classifier = None
+_classifier_lock = threading.Lock()
 
-        inputs = tokenizer.encode(premise, hypothesis, return_tensors='pt', truncation=True)
 
-        with torch.no_grad():
-            logits = model(inputs)[0] 
+# Returns the process-wide classifier, creating it on first use
+def get_classifier():
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = ZeroShotClassifier()
+    return _classifier
 
-        probabilities = logits.softmax(dim=1)
 
-        prob_label_is_true = probabilities[0][2].item()
-        results[label] = prob_label_is_true
+# Takes in many items and categories, and outputs (label, probabilities) for each item.
+# Previously seen references are answered from the categorisation cache and only the
+# distinct misses go through the model.
+def classify_many(descriptions, candidate_labels, use_cache=True):
+    descriptions = list(descriptions)
+    candidate_labels = list(candidate_labels)
+    if not use_cache:
+        return get_classifier().classify_many(descriptions, candidate_labels)
 
-    best_label = max(results, key=results.get)
+    cache = get_category_cache()
+    known = cache.get_many(descriptions, candidate_labels)
+
+    misses = {}
+    for description in descriptions:
+        ref = normalise_ref(description)
+        if ref not in known and ref not in misses:
+            misses[ref] = description
+    if misses:
+        fresh = dict(zip(misses, get_classifier().classify_many(list(misses.values()), candidate_labels)))
+        cache.put_many(fresh, candidate_labels)
+        known.update(fresh)
+
+    return [known[normalise_ref(description)] for description in descriptions]
+
+
+# Takes in item and categories, and outputs most likely category
+def classify_item(item_description, candidate_labels):
+    best_label, _ = classify_many([item_description], candidate_labels)[0]
     return best_label
 
 if __name__ == "__main__":
     print("Please enter the item: ")
     item_description = input()
-    
+
     candidate_labels = [
         "Food",
         "Transportation",
@@ -41,6 +135,6 @@ if __name__ == "__main__":
         "Entertainment",
         "Miscellaneous"
     ]
-    
+
     label = classify_item(item_description, candidate_labels)
-    print(f"The item '{item_description}' is categorized as '{label}'")
\ No newline at end of file
+    print(f"The item '{item_description}' is categorized as '{label}'")
@@ -1,5 +1,6 @@
-from .database import create_connection, add_file_transaction_data, add_file_account_data, add_transaction, get_account_transactions, add_account, change_interest_rate, alter_account_balance, init_db, get_all_transaction_data, get_user, add_user, get_user_transactions, get_user_accounts, update_conversation, get_dialogue, get_transactions_in_time, get_expenses_per_category, get_expenses_per_category
+from .database import create_connection, validate_transaction_row, add_file_transaction_data, add_file_account_data, add_transaction, get_account_transactions, add_account, change_interest_rate, alter_account_balance, init_db, get_all_transaction_data, get_user, add_user, change_password, get_user_transactions, get_user_accounts, get_account_balances, get_balance, update_conversation, get_dialogue, get_transactions_in_time, get_expenses_per_category, get_expenses_per_category, ingest_transaction_file, bootstrap_db, seed_db, get_user_id, iter_user_transactions, get_user_transactions_page, get_category_transactions, get_spending_by_category, get_digest_totals, get_digest_recipients, get_spending_buckets, rebuild_daily_totals, add_message, iter_recent_messages, get_messages_between, get_conversation_summary, set_conversation_summary, get_latest_transaction_id, get_latest_activity_day, get_large_transactions, search_transactions
+from .migrations import migrate, check_query_plans, get_schema_version, SCHEMA_VERSION
 
 DATABASE_FILE = "finance.db"
 
-__all__ = ["create_connection, add_file_transaction_data, add_file_account_data, DATABASE_FILE, add_transaction, get_account_transactions, add_account, change_interest_rate, alter_account_balance, init_db, get_all_transaction_data, get_user, add_user, get_user_transactions, get_user_accounts, update_conversation, get_dialogue, get_transactions_in_time, get_expenses_per_category, get_expenses_per_category"]
\ No newline at end of file
+__all__ = ["create_connection, validate_transaction_row, add_file_transaction_data, add_file_account_data, DATABASE_FILE, add_transaction, get_account_transactions, add_account, change_interest_rate, alter_account_balance, init_db, get_all_transaction_data, get_user, add_user, change_password, get_user_transactions, get_user_accounts, get_account_balances, get_balance, update_conversation, get_dialogue, get_transactions_in_time, get_expenses_per_category, get_expenses_per_category, ingest_transaction_file, bootstrap_db, seed_db, get_user_id, iter_user_transactions, get_user_transactions_page, get_category_transactions, get_spending_by_category, get_digest_totals, get_digest_recipients, get_spending_buckets, rebuild_daily_totals, add_message, iter_recent_messages, get_messages_between, get_conversation_summary, set_conversation_summary, get_latest_transaction_id, get_latest_activity_day, get_large_transactions, search_transactions, migrate, check_query_plans, get_schema_version, SCHEMA_VERSION"]
\ No newline at end of file
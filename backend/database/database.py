@@ -1,6 +1,22 @@
+import csv
+import hashlib
+import itertools
+import math
+import os
 import sqlite3
 from utils import User
 from datetime import datetime
+from time import perf_counter
+from .migrations import migrate, get_schema_version, FINGERPRINT_SQL, SCHEMA_VERSION
+from .queries import (
+    TRANSACTION_COLUMNS, GET_USER_SQL, GET_USER_ACCOUNTS_SQL, GET_ACCOUNT_TRANSACTIONS_SQL, GET_TRANSACTIONS_IN_TIME_SQL,
+    GET_CATEGORY_TRANSACTIONS_SQL, GET_EXPENSES_PER_CATEGORY_SQL, GET_SPENDING_BY_CATEGORY_SQL, user_transactions_sql,
+)
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample")
+
+# Number of csv rows parsed and inserted per executemany batch during ingest
+TRANSACTION_CHUNK_SIZE = 5000
 
 '''Creates a connection to the database specified by file and returns it'''
 def create_connection(file):
@@ -52,34 +68,165 @@ def create_tables(connection):
     
     connection.commit()
     cursor.close()
+    migrate(connection)
 
-'''Initialises the database'''
+'''Wipes the database and reinitialises it with the sample data'''
 def init_db(connection):
     reset_db(connection)
     create_tables(connection)
-    add_file_account_data(connection, "./sample/sample_account_data.csv")
-    add_file_transaction_data(connection, "./sample/sample_transaction_data.csv")
-    add_file_user_data(connection, "./sample/sample_user_data.csv")
+    seed_db(connection)
     update_conversation(connection, "")
-    
+
+'''Creates any missing tables and applies pending migrations without touching existing data.
+Returns straight away once the schema is current, so it is cheap to call on every start-up
+and safe for several workers to run at once. Sample data is only loaded when <seed> is set.'''
+def bootstrap_db(connection, seed=False):
+    if get_schema_version(connection) < SCHEMA_VERSION:
+        create_tables(connection)
+    if seed:
+        seed_db(connection)
+
+'''Loads the sample users, accounts and transactions, unless the database already has users'''
+def seed_db(connection):
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT EXISTS (SELECT 1 FROM users);
+    ''')
+    seeded = cursor.fetchone()[0]
+    cursor.close()
+    if seeded:
+        return False
+    add_file_account_data(connection, os.path.join(SAMPLE_DIR, "sample_account_data.csv"))
+    add_file_transaction_data(connection, os.path.join(SAMPLE_DIR, "sample_transaction_data.csv"))
+    add_file_user_data(connection, os.path.join(SAMPLE_DIR, "sample_user_data.csv"))
+    return True
+
 
 '''Adds transaction data from a csv file specified by filepath'''
 def add_file_transaction_data(connection, filepath):
-    transactions = []
-    with open(filepath, "r") as file1:
-        for line in file1:
-            data = line.strip().split(",")
-            date = data[1].strip().split("-")
-            time = data[2].strip().split(":")
-            transactions.append((data[0], data[5], float(data[4]), datetime(int(date[0]), int(date[1]), int(date[2]), int(time[0]), int(time[1])), data[3]))
-            alter_account_balance(connection, float(data[4]), data[0])
+    return ingest_transaction_file(connection, filepath)
+
+'''Parses a transaction csv row (accountno, date, time, category, value, ref) into the tuple inserted into transactions'''
+def parse_transaction_row(row):
+    date = row[1].strip().split("-")
+    time = row[2].strip().split(":")
+    return (row[0].strip(), row[5].strip(), float(row[4]), datetime(int(date[0]), int(date[1]), int(date[2]), int(time[0]), int(time[1])), row[3].strip())
+
+'''Parses a transaction csv row like parse_transaction_row, raising ValueError with a readable reason when the row is malformed'''
+def validate_transaction_row(row):
+    if len(row) != 6:
+        raise ValueError(f"expected 6 fields, got {len(row)}")
+    if not row[0].strip():
+        raise ValueError("missing account number")
+    try:
+        parsed = parse_transaction_row(row)
+    except (ValueError, IndexError):
+        raise ValueError(f"invalid date, time or value: {row[1].strip()!r} {row[2].strip()!r} {row[4].strip()!r}")
+    if not math.isfinite(parsed[2]):
+        raise ValueError(f"invalid value: {row[4].strip()!r}")
+    return parsed
+
+'''Returns the sha256 hex digest of a file, read in blocks'''
+def file_sha256(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as file1:
+        for block in iter(lambda: file1.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+'''Streams a transaction csv file into the database in chunks of <chunk_size> rows.
+Ingest is idempotent: a file whose contents were imported before is skipped after one
+lookup of its hash, and rows already present (from an overlapping statement) are
+recognised by their fingerprint and left out, so only new rows are inserted and only
+they change account balances and the daily totals. Rows are staged in a temporary table on disk,
+inserted in one statement and balances are changed with one update grouped by account,
+all in a single transaction. Returns the rows read, rows inserted, duplicate rows,
+whether the file was skipped, seconds taken and rows/sec.'''
+def ingest_transaction_file(connection, filepath, chunk_size=TRANSACTION_CHUNK_SIZE):
+    start = perf_counter()
+    sha256 = file_sha256(filepath)
+    rows = 0
+    inserted = 0
+    skipped = False
     cursor = connection.cursor()
-    cursor.executemany('''
-        INSERT INTO transactions (accountno, ref, val, time, category)
-        VALUES (?, ?, ?, ?, ?);
-    ''', transactions)
-    connection.commit()
-    cursor.close()
+    # Pooled connections keep temporary tables in memory; the staging table is as large as
+    # the file, so it goes to a temporary file for the length of the ingest instead
+    cursor.execute('PRAGMA temp_store;')
+    temp_store = cursor.fetchone()[0]
+    if temp_store == 2:
+        cursor.execute('PRAGMA temp_store = FILE;')
+    try:
+        if not connection.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE;')
+        cursor.execute('SELECT 1 FROM imports WHERE sha256 = ?;', (sha256,))
+        skipped = cursor.fetchone() is not None
+        if not skipped:
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM transactions;')
+            last_id = cursor.fetchone()[0]
+            cursor.execute('''
+                CREATE TEMP TABLE IF NOT EXISTS staged_transactions (
+                    accountno TEXT, ref TEXT, val REAL, time TIMESTAMP, category TEXT
+                );
+            ''')
+            cursor.execute('DELETE FROM temp.staged_transactions;')
+
+            with open(filepath, "r", newline="") as file1:
+                reader = csv.reader(file1)
+                while True:
+                    lines = list(itertools.islice(reader, chunk_size))
+                    if not lines:
+                        break
+                    chunk = [parse_transaction_row(line) for line in lines if line]
+                    cursor.executemany('''
+                        INSERT INTO temp.staged_transactions (accountno, ref, val, time, category)
+                        VALUES (?, ?, ?, ?, ?);
+                    ''', chunk)
+                    rows += len(chunk)
+
+            cursor.execute('''
+                INSERT OR IGNORE INTO transactions (accountno, ref, val, time, category, fingerprint)
+                SELECT accountno, ref, val, time, category,
+                    {fingerprint} || '|' || ROW_NUMBER() OVER (PARTITION BY {fingerprint} ORDER BY rowid)
+                FROM temp.staged_transactions
+                ORDER BY rowid;
+            '''.format(fingerprint=FINGERPRINT_SQL))
+            inserted = cursor.rowcount
+            cursor.execute('DELETE FROM temp.staged_transactions;')
+
+            cursor.execute('''
+                UPDATE accounts
+                SET balance = balance + totals.change
+                FROM (
+                    SELECT accountno, SUM(val) AS change
+                    FROM transactions
+                    WHERE id > ?
+                    GROUP BY accountno
+                ) AS totals
+                WHERE accounts.accountno = totals.accountno;
+            ''', (last_id,))
+            add_to_daily_totals(cursor, last_id)
+            cursor.execute('''
+                INSERT INTO imports (sha256, filename, rows, inserted)
+                VALUES (?, ?, ?, ?);
+            ''', (sha256, os.path.basename(filepath), rows, inserted))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        if temp_store == 2:
+            cursor.execute('PRAGMA temp_store = MEMORY;')
+        cursor.close()
+
+    seconds = perf_counter() - start
+    return {
+        "rows": rows,
+        "inserted": inserted,
+        "duplicates": rows - inserted,
+        "skipped": skipped,
+        "seconds": seconds,
+        "rows_per_sec": rows / seconds if seconds > 0 else 0.0,
+    }
 
 '''Adds account data from a csv file specified by filepath'''
 def add_file_account_data(connection, filepath):
@@ -114,13 +261,61 @@ def add_file_user_data(connection, filepath):
 '''Adds the data from a transaction object to the database'''
 def add_transaction(connection, transaction):
     cursor = connection.cursor()
+    # Numbered after any identical transactions already stored, as an imported statement
+    # would number it, so a later import of the same row is recognised as a duplicate
+    cursor.execute('''
+        WITH new AS (
+            SELECT ? AS accountno, ? AS ref, ? AS val, ? AS time, ? AS category
+        ), keyed AS (
+            SELECT *, {fingerprint} AS base
+            FROM new
+        )
+        INSERT INTO transactions (accountno, ref, val, time, category, fingerprint)
+        SELECT accountno, ref, val, time, category, base || '|' || (
+            SELECT COUNT(*) + 1
+            FROM transactions
+            WHERE fingerprint > keyed.base || '|' AND fingerprint < keyed.base || '}}'
+        )
+        FROM keyed;
+    '''.format(fingerprint=FINGERPRINT_SQL), (transaction.accountno, transaction.ref, transaction.value, transaction.time, transaction.category))
     cursor.execute('''
-       INSERT INTO transactions (accountno, ref, val, time, category)
-       VALUES (?, ?, ?, ?, ?);
-    ''', (transaction.accountno, transaction.ref, transaction.value, transaction.time, transaction.category))
+        INSERT INTO daily_account_category_totals (accountno, day, category, total, count)
+        VALUES (?, date(?), COALESCE(?, ''), ?, 1)
+        ON CONFLICT (accountno, day, category) DO UPDATE
+        SET total = total + excluded.total, count = count + excluded.count;
+    ''', (transaction.accountno, transaction.time, transaction.category, transaction.value))
     connection.commit()
     cursor.close()
 
+'''Adds every transaction with an id above <after_id> to the daily totals rollup'''
+def add_to_daily_totals(cursor, after_id):
+    cursor.execute('''
+        INSERT INTO daily_account_category_totals (accountno, day, category, total, count)
+        SELECT accountno, date(time), COALESCE(category, ''), SUM(val), COUNT(*)
+        FROM transactions
+        WHERE id > ?
+        GROUP BY accountno, date(time), COALESCE(category, '')
+        ON CONFLICT (accountno, day, category) DO UPDATE
+        SET total = total + excluded.total, count = count + excluded.count;
+    ''', (after_id,))
+
+'''Recomputes the daily totals rollup from the transactions table, for backfills and repairs'''
+def rebuild_daily_totals(connection):
+    cursor = connection.cursor()
+    try:
+        if not connection.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE;')
+        cursor.execute('''
+            DELETE FROM daily_account_category_totals;
+        ''')
+        add_to_daily_totals(cursor, 0)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
 '''Adds the data from an account object to the database'''
 def add_account(connection, account):
     cursor = connection.cursor()
@@ -138,6 +333,19 @@ def add_user(connection, user):
         INSERT INTO users (username, email, password)
         VALUES (?, ?, ?);               
     ''', (user.username, user.email, user.password))
+    user.id = cursor.lastrowid
+    connection.commit()
+    cursor.close()
+    return user.id
+
+'''Replaces a user's password hash'''
+def change_password(connection, userid, password):
+    cursor = connection.cursor()
+    cursor.execute('''
+        UPDATE users
+        SET password = ?
+        WHERE id = ?;
+    ''', (password, userid))
     connection.commit()
     cursor.close()
 
@@ -178,17 +386,34 @@ def reset_db(connection):
     cursor.execute('''
         DROP TABLE IF EXISTS conversation;
     ''')
+    cursor.execute('''
+        DROP TABLE IF EXISTS daily_account_category_totals;
+    ''')
+    cursor.execute('''
+        DROP TABLE IF EXISTS messages;
+    ''')
+    cursor.execute('''
+        DROP TABLE IF EXISTS conversation_summaries;
+    ''')
+    cursor.execute('''
+        DROP TABLE IF EXISTS transactions_fts;
+    ''')
+    cursor.execute('''
+        DROP TABLE IF EXISTS jobs;
+    ''')
+    cursor.execute('''
+        DROP TABLE IF EXISTS imports;
+    ''')
+    cursor.execute('''
+        PRAGMA user_version = 0;
+    ''')
     connection.commit()
     cursor.close()
     
 '''Takes a database connection and account number and returns all transactions associates with that account'''
 def get_account_transactions(connection, accountno):
     cursor = connection.cursor()
-    cursor.execute('''
-        SELECT * 
-        FROM transactions
-        WHERE accountno = ?;
-    ''', (accountno,))
+    cursor.execute(GET_ACCOUNT_TRANSACTIONS_SQL, (accountno,))
     records = cursor.fetchall()
     cursor.close()
     return records
@@ -196,8 +421,8 @@ def get_account_transactions(connection, accountno):
 '''Testing method that gets all transaction data''' #TODO remove
 def get_all_transaction_data(connection):
     cursor = connection.cursor()
-    cursor.execute('''
-        SELECT *
+    cursor.execute(f'''
+        SELECT {TRANSACTION_COLUMNS}
         FROM transactions;
     ''')
     records = cursor.fetchall()
@@ -209,25 +434,25 @@ def get_all_transaction_data(connection):
 '''Fetches a user record from the database and returns a User object'''
 def get_user(connection, username):
     cursor = connection.cursor()
-    cursor.execute('''
-        SELECT username, email, password
-        FROM users
-        WHERE username = ?               
-    ''', (username,))
+    cursor.execute(GET_USER_SQL, (username,))
     user = cursor.fetchone()
     cursor.close()
     if user:
         user_obj = User()
-        user_obj.username, user_obj.email, user_obj.password = user
+        user_obj.id, user_obj.username, user_obj.email, user_obj.password = user
         return user_obj
     return None
 
-'''Sums a users transactions'''
+'''Sums an account's transactions'''
 def get_balance(connection, accountno):
-    records = get_account_transactions(connection, accountno)
-    bal = 0
-    for record in records:
-        bal += record[-2]
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT COALESCE(SUM(val), 0)
+        FROM transactions
+        WHERE accountno = ?;
+    ''', (accountno,))
+    bal = cursor.fetchone()[0]
+    cursor.close()
     return bal
 
 def get_dialogue(connection): # HACK
@@ -245,62 +470,91 @@ def get_dialogue(connection): # HACK
         cursor.close()
 
 '''Returns a dictionary of all of a user's account information'''
-def get_user_accounts(connection, username):
-    cursor1 = connection.cursor()
-    cursor1.execute('''
-        SELECT userid
-        FROM users
-        WHERE username = ?;            
-    ''', (username,))
-    userid = cursor1.fetchone()[0]
-    cursor1.close()
-    
+def get_user_accounts(connection, userid):
     cursor2 = connection.cursor()
-    cursor2.execute('''
-        SELECT *
-        FROM accounts
-        WHERE userid = ?;
-    ''', (userid,))
+    cursor2.execute(GET_USER_ACCOUNTS_SQL, (userid,))
     accounts = cursor2.fetchall()
     cursor2.close()
     
     column_names = [description[0] for description in cursor2.description]
     return [dict(zip(column_names, account)) for account in accounts]
 
-'''Gets all of a users transactions'''
-def get_user_transactions(connection, username):
-    cursor1 = connection.cursor()
-    cursor1.execute('''
+'''Returns (accountno, userid, balance, interest_rate) for one user's accounts, or for every account when userid is None'''
+def get_account_balances(connection, userid=None):
+    cursor = connection.cursor()
+    if userid is None:
+        cursor.execute('''
+            SELECT accountno, userid, balance, COALESCE(interest_rate, 0)
+            FROM accounts
+            ORDER BY userid, accountno;
+        ''')
+    else:
+        cursor.execute('''
+            SELECT accountno, userid, balance, COALESCE(interest_rate, 0)
+            FROM accounts
+            WHERE userid = ?
+            ORDER BY accountno;
+        ''', (userid,))
+    accounts = cursor.fetchall()
+    cursor.close()
+    return accounts
+
+'''Returns the id of the user with the given username, or None'''
+def get_user_id(connection, username):
+    cursor = connection.cursor()
+    cursor.execute('''
         SELECT id
         FROM users
-        WHERE username = ?;            
+        WHERE username = ?;
     ''', (username,))
-    result = cursor1.fetchone()
-    userid = result[0]
-    cursor1.close()
-    
-    cursor2 = connection.cursor()
-    cursor2.execute('''
-        SELECT accountno
-        FROM accounts
-        WHERE userid = ?;
-    ''', (userid,))
-    accountnos = [no[0] for no in cursor2.fetchall()]
-    
-    ret = []
-    for no in accountnos:
-        cursor = connection.cursor()
-        cursor.execute('''
-            SELECT *
-            FROM transactions
-            WHERE accountno = ?;
-        ''', (no,))
-        records = cursor.fetchall()
-        column_names = [description[0] for description in cursor.description]
-        temp = [dict(zip(column_names, record)) for record in records]
-        ret += temp
+    result = cursor.fetchone()
     cursor.close()
-    return ret
+    return result[0] if result else None
+
+'''Gets all of a users transactions'''
+def get_user_transactions(connection, userid):
+    return list(iter_user_transactions(connection, userid))
+
+'''Yields a user's transactions as dicts in (time, id) order from a single query without
+loading them all into memory. Rows can be limited to times in [start, end), a category and
+an account; <after> is a (time, id) keyset cursor and only rows after it are returned.'''
+def iter_user_transactions(connection, userid, start=None, end=None, category=None, accountno=None, after=None, limit=None):
+    clauses = ["accounts.userid = ?"]
+    params = [userid]
+    if start is not None:
+        clauses.append("transactions.time >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("transactions.time < ?")
+        params.append(end)
+    if category is not None:
+        clauses.append("transactions.category = ?")
+        params.append(category)
+    if accountno is not None:
+        clauses.append("transactions.accountno = ?")
+        params.append(accountno)
+    if after is not None:
+        clauses.append("(transactions.time, transactions.id) > (?, ?)")
+        params.extend(after)
+    params.append(-1 if limit is None else limit)
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(user_transactions_sql(clauses), params)
+        column_names = [description[0] for description in cursor.description]
+        for record in cursor:
+            yield dict(zip(column_names, record))
+    finally:
+        cursor.close()
+
+'''Returns a page of at most <limit> of a user's transactions and the (time, id) cursor of
+the next page, which is None on the last page. Takes the same filters as iter_user_transactions.'''
+def get_user_transactions_page(connection, userid, limit=100, after=None, **filters):
+    records = list(iter_user_transactions(connection, userid, after=after, limit=limit + 1, **filters))
+    if len(records) > limit:
+        last = records[limit - 1]
+        return records[:limit], (last["time"], last["id"])
+    return records, None
 
 '''Updates the conversation history for the chat ai'''
 def update_conversation(connection, history):
@@ -312,39 +566,239 @@ def update_conversation(connection, history):
     connection.commit()
     cursor.close()
 
-'''Takes a database connection and account number and range of dates and returns all the transactions during those times'''
-def get_transactions_in_time(connection, accountno, starttime, endtime):
+'''Appends a message to a user's conversation as the next turn and returns the turn number'''
+def add_message(connection, userid, role, content, tokens):
     cursor = connection.cursor()
     cursor.execute('''
-        SELECT SUM(val) as Expense
-        FROM transactions
-        WHERE accountno = ? and time > ? and time < ?;
-    ''', accountno, starttime, endtime)
+        INSERT INTO messages (userid, turn, role, content, tokens)
+        SELECT ?, COALESCE(MAX(turn), 0) + 1, ?, ?, ?
+        FROM messages
+        WHERE userid = ?;
+    ''', (userid, role, content, tokens, userid))
+    cursor.execute('''
+        SELECT turn
+        FROM messages
+        WHERE id = ?;
+    ''', (cursor.lastrowid,))
+    turn = cursor.fetchone()[0]
+    connection.commit()
+    cursor.close()
+    return turn
+
+'''Yields (turn, role, content, tokens) for a user's messages after <after_turn>, newest first'''
+def iter_recent_messages(connection, userid, after_turn=0):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('''
+            SELECT turn, role, content, tokens
+            FROM messages
+            WHERE userid = ? AND turn > ?
+            ORDER BY turn DESC;
+        ''', (userid, after_turn))
+        yield from cursor
+    finally:
+        cursor.close()
+
+'''Returns (turn, role, content, tokens) for a user's messages with after_turn < turn < before_turn, oldest first'''
+def get_messages_between(connection, userid, after_turn, before_turn):
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT turn, role, content, tokens
+        FROM messages
+        WHERE userid = ? AND turn > ? AND turn < ?
+        ORDER BY turn;
+    ''', (userid, after_turn, before_turn))
     records = cursor.fetchall()
     cursor.close()
     return records
 
+'''Returns (summary, upto_turn, tokens) for a user's rolling conversation summary, or None'''
+def get_conversation_summary(connection, userid):
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT summary, upto_turn, tokens
+        FROM conversation_summaries
+        WHERE userid = ?;
+    ''', (userid,))
+    record = cursor.fetchone()
+    cursor.close()
+    return record
+
+'''Stores a user's rolling conversation summary, covering every turn up to <upto_turn>'''
+def set_conversation_summary(connection, userid, summary, upto_turn, tokens):
+    cursor = connection.cursor()
+    cursor.execute('''
+        INSERT INTO conversation_summaries (userid, summary, upto_turn, tokens)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (userid) DO UPDATE
+        SET summary = excluded.summary, upto_turn = excluded.upto_turn, tokens = excluded.tokens;
+    ''', (userid, summary, upto_turn, tokens))
+    connection.commit()
+    cursor.close()
+
+'''Takes a database connection and account number and range of dates and returns the total value of the transactions during those times'''
+def get_transactions_in_time(connection, accountno, starttime, endtime):
+    cursor = connection.cursor()
+    cursor.execute(GET_TRANSACTIONS_IN_TIME_SQL, (accountno, starttime, endtime))
+    total = cursor.fetchone()[0]
+    cursor.close()
+    return total
+
 '''Takes a database connection and account number and a category and returns all the transactions in that category'''
 def get_category_transactions(connection, accountno, category):
     cursor = connection.cursor()
-    cursor.execute('''
-        SELECT ref as Item, val as Expense, time as Time
-        FROM transactions
-        WHERE accountno = ? and category = ?;
-    ''', accountno, category)
+    cursor.execute(GET_CATEGORY_TRANSACTIONS_SQL, (accountno, category))
     records = cursor.fetchall()
     cursor.close()
     return records
 
 '''Takes a database connection and account number and returns an ordered list of the categories in terms of expense and the expense'''
 def get_expenses_per_category(connection, accountno):
+    cursor = connection.cursor()
+    cursor.execute(GET_EXPENSES_PER_CATEGORY_SQL, (accountno,))
+    records = cursor.fetchall()
+    cursor.close()
+    return records
+
+'''SQLite expressions that label a rollup day with the day, week (starting Monday) or month it falls in'''
+BUCKET_EXPRESSIONS = {
+    "day": "totals.day",
+    "week": "date(totals.day, '-6 days', 'weekday 1')",
+    "month": "substr(totals.day, 1, 7)",
+}
+
+'''Returns (category, total, count, previous_total, previous_count) for each of a user's categories,
+where the totals cover the days in [start, end) and the previous ones the days in [previous_start, start).
+Reads the daily rollup, so the cost depends on the number of days rather than transactions.'''
+def get_spending_by_category(connection, userid, previous_start, start, end):
+    cursor = connection.cursor()
+    cursor.execute(GET_SPENDING_BY_CATEGORY_SQL, (start, start, start, start, userid, previous_start, end))
+    records = cursor.fetchall()
+    cursor.close()
+    return records
+
+'''Returns (userid, category, week_total, week_count, previous_week_total, month_total, month_count, previous_month_total)
+for every user and category in one pass over the daily rollup. The current periods are [week_start, end) and
+[month_start, end), the previous ones [previous_week_start, week_start) and [previous_month_start, month_start).
+Only one user's rows are returned when userid is given.'''
+def get_digest_totals(connection, previous_week_start, week_start, previous_month_start, month_start, end, userid=None):
+    windows = (week_start, week_start, previous_week_start, week_start, month_start, month_start, previous_month_start, month_start)
+    start = min(previous_week_start, previous_month_start)
+    cursor = connection.cursor()
+    cursor.execute(f'''
+        SELECT accounts.userid, NULLIF(totals.category, '') AS category,
+            COALESCE(SUM(CASE WHEN totals.day >= date(?) THEN totals.total END), 0),
+            COALESCE(SUM(CASE WHEN totals.day >= date(?) THEN totals.count END), 0),
+            COALESCE(SUM(CASE WHEN totals.day >= date(?) AND totals.day < date(?) THEN totals.total END), 0),
+            COALESCE(SUM(CASE WHEN totals.day >= date(?) THEN totals.total END), 0),
+            COALESCE(SUM(CASE WHEN totals.day >= date(?) THEN totals.count END), 0),
+            COALESCE(SUM(CASE WHEN totals.day >= date(?) AND totals.day < date(?) THEN totals.total END), 0)
+        FROM daily_account_category_totals AS totals
+        JOIN accounts ON accounts.accountno = totals.accountno
+        WHERE totals.day >= date(?) AND totals.day < date(?){' AND accounts.userid = ?' if userid is not None else ''}
+        GROUP BY accounts.userid, totals.category
+        ORDER BY accounts.userid;
+    ''', windows + (start, end) + ((userid,) if userid is not None else ()))
+    records = cursor.fetchall()
+    cursor.close()
+    return records
+
+'''Returns (id, username, email) for every user with an email address, or only for the given user'''
+def get_digest_recipients(connection, userid=None):
+    cursor = connection.cursor()
+    if userid is None:
+        cursor.execute('''
+            SELECT id, username, email
+            FROM users
+            WHERE email != ''
+            ORDER BY id;
+        ''')
+    else:
+        cursor.execute('''
+            SELECT id, username, email
+            FROM users
+            WHERE id = ? AND email != '';
+        ''', (userid,))
+    records = cursor.fetchall()
+    cursor.close()
+    return records
+
+'''Returns (period, total, count) for each day, week or month in [start, end) that a user has transactions in'''
+def get_spending_buckets(connection, userid, start, end, bucket="day"):
+    expression = BUCKET_EXPRESSIONS[bucket]
+    cursor = connection.cursor()
+    cursor.execute(f'''
+        SELECT {expression} AS period, SUM(totals.total) AS total, SUM(totals.count) AS count
+        FROM accounts
+        JOIN daily_account_category_totals AS totals ON totals.accountno = accounts.accountno
+        WHERE accounts.userid = ? AND totals.day >= date(?) AND totals.day < date(?)
+        GROUP BY period
+        ORDER BY period;
+    ''', (userid, start, end))
+    records = cursor.fetchall()
+    cursor.close()
+    return records
+
+'''Returns the id of the newest transaction in the database, or 0. Ids only grow, so a change
+means transactions were added, whichever process added them.'''
+def get_latest_transaction_id(connection):
     cursor = connection.cursor()
     cursor.execute('''
-        SELECT category, SUM(val) as Expense
-        ORDER BY expense DES
-        FROM transactions
-        WHERE accountno = ?;
-    ''', accountno)
+        SELECT COALESCE(MAX(id), 0)
+        FROM transactions;
+    ''')
+    latest = cursor.fetchone()[0]
+    cursor.close()
+    return latest
+
+'''Returns the most recent day with any of the user's transactions, from the daily rollup'''
+def get_latest_activity_day(connection, userid):
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT MAX(totals.day)
+        FROM accounts
+        JOIN daily_account_category_totals AS totals ON totals.accountno = accounts.accountno
+        WHERE accounts.userid = ?;
+    ''', (userid,))
+    day = cursor.fetchone()[0]
+    cursor.close()
+    return day
+
+'''Returns up to <limit> of a user's largest transactions by absolute value since <start>, as (time, ref, category, val, accountno)'''
+def get_large_transactions(connection, userid, start, limit=5):
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT transactions.time, transactions.ref, transactions.category, transactions.val, transactions.accountno
+        FROM accounts
+        JOIN transactions ON transactions.accountno = accounts.accountno
+        WHERE accounts.userid = ? AND transactions.time >= ?
+        ORDER BY ABS(transactions.val) DESC
+        LIMIT ?;
+    ''', (userid, start, limit))
+    records = cursor.fetchall()
+    cursor.close()
+    return records
+
+'''Full-text searches a user's transaction references and categories with an FTS5 <match> expression.
+Returns up to <limit> (ref, category, count, total, latest_time) groups, best match first.'''
+def search_transactions(connection, userid, match, limit=5):
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT transactions.ref, transactions.category, COUNT(*), SUM(transactions.val), MAX(transactions.time)
+        FROM (
+            SELECT rowid, rank
+            FROM transactions_fts
+            WHERE transactions_fts MATCH ?
+            ORDER BY rank
+            LIMIT -1
+        ) AS matches
+        JOIN transactions ON transactions.id = matches.rowid
+        JOIN accounts ON accounts.accountno = transactions.accountno
+        WHERE accounts.userid = ?
+        GROUP BY transactions.ref, transactions.category
+        ORDER BY MIN(matches.rank), COUNT(*) DESC
+        LIMIT ?;
+    ''', (match, userid, limit))
     records = cursor.fetchall()
     cursor.close()
     return records
@@ -0,0 +1,244 @@
+import re
+
+from .queries import (
+    GET_USER_SQL, GET_USER_ACCOUNTS_SQL, GET_ACCOUNT_TRANSACTIONS_SQL, GET_TRANSACTIONS_IN_TIME_SQL, GET_CATEGORY_TRANSACTIONS_SQL,
+    GET_EXPENSES_PER_CATEGORY_SQL, GET_SPENDING_BY_CATEGORY_SQL, user_transactions_sql,
+)
+
+'''Content fingerprint of a transaction, without its occurrence number. Identical transactions
+(same account, time, value and reference) within one statement are told apart by appending
+their position among the identical rows, so the full fingerprint is
+FINGERPRINT_SQL || '|' || ROW_NUMBER() OVER (PARTITION BY FINGERPRINT_SQL ORDER BY id).'''
+FINGERPRINT_SQL = "accountno || '|' || time || '|' || printf('%.2f', val) || '|' || COALESCE(ref, '')"
+
+'''Schema migrations, applied in order. Each entry is (version, description, steps) where a
+step is either an SQL statement or a function taking the connection. The highest applied
+version is stored in PRAGMA user_version, so each migration runs exactly once per database.'''
+MIGRATIONS = [
+    (1, "secondary indexes for transaction, account and user lookups", [
+        '''
+            CREATE INDEX IF NOT EXISTS idx_transactions_account_time
+            ON transactions (accountno, time);
+        ''',
+        '''
+            CREATE INDEX IF NOT EXISTS idx_transactions_account_category
+            ON transactions (accountno, category);
+        ''',
+        '''
+            CREATE INDEX IF NOT EXISTS idx_accounts_userid
+            ON accounts (userid);
+        ''',
+        '''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username
+            ON users (username);
+        ''',
+    ]),
+    (2, "daily per-account, per-category rollup of transaction totals", [
+        '''
+            CREATE TABLE IF NOT EXISTS daily_account_category_totals (
+                accountno TEXT NOT NULL,
+                day TEXT NOT NULL,
+                category TEXT NOT NULL DEFAULT '',
+                total REAL NOT NULL DEFAULT 0,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (accountno, day, category)
+            ) WITHOUT ROWID;
+        ''',
+        '''
+            INSERT INTO daily_account_category_totals (accountno, day, category, total, count)
+            SELECT accountno, date(time), COALESCE(category, ''), SUM(val), COUNT(*)
+            FROM transactions
+            WHERE true
+            GROUP BY accountno, date(time), COALESCE(category, '')
+            ON CONFLICT (accountno, day, category) DO NOTHING;
+        ''',
+    ]),
+    (3, "per-user chat message log and rolling conversation summaries", [
+        '''
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                userid INTEGER NOT NULL,
+                turn INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(userid) REFERENCES users(id)
+            );
+        ''',
+        '''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_user_turn
+            ON messages (userid, turn);
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS conversation_summaries (
+                userid INTEGER PRIMARY KEY,
+                summary TEXT NOT NULL,
+                upto_turn INTEGER NOT NULL,
+                tokens INTEGER NOT NULL,
+                FOREIGN KEY(userid) REFERENCES users(id)
+            );
+        ''',
+    ]),
+    (4, "full-text index over transaction references and categories", [
+        '''
+            CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts
+            USING fts5(ref, category, content='transactions', content_rowid='id', tokenize='porter unicode61');
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN
+                INSERT INTO transactions_fts (rowid, ref, category)
+                VALUES (new.id, new.ref, new.category);
+            END;
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions BEGIN
+                INSERT INTO transactions_fts (transactions_fts, rowid, ref, category)
+                VALUES ('delete', old.id, old.ref, old.category);
+            END;
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS transactions_fts_update AFTER UPDATE OF ref, category ON transactions BEGIN
+                INSERT INTO transactions_fts (transactions_fts, rowid, ref, category)
+                VALUES ('delete', old.id, old.ref, old.category);
+                INSERT INTO transactions_fts (rowid, ref, category)
+                VALUES (new.id, new.ref, new.category);
+            END;
+        ''',
+        '''
+            INSERT INTO transactions_fts (transactions_fts)
+            VALUES ('rebuild');
+        ''',
+    ]),
+    (5, "background job queue", [
+        '''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                userid INTEGER,
+                status TEXT NOT NULL DEFAULT 'queued',
+                progress REAL NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3,
+                result TEXT,
+                error TEXT,
+                worker TEXT,
+                created REAL NOT NULL,
+                run_after REAL NOT NULL DEFAULT 0,
+                started REAL,
+                finished REAL,
+                duration REAL
+            );
+        ''',
+        '''
+            CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after
+            ON jobs (status, run_after);
+        ''',
+    ]),
+    (6, "transaction fingerprints and imported file hashes for idempotent ingest", [
+        '''
+            ALTER TABLE transactions ADD COLUMN fingerprint TEXT;
+        ''',
+        '''
+            UPDATE transactions
+            SET fingerprint = keyed.fingerprint
+            FROM (
+                SELECT id, {fingerprint} || '|' || ROW_NUMBER() OVER (PARTITION BY {fingerprint} ORDER BY id) AS fingerprint
+                FROM transactions
+            ) AS keyed
+            WHERE transactions.id = keyed.id;
+        '''.format(fingerprint=FINGERPRINT_SQL),
+        '''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_fingerprint
+            ON transactions (fingerprint)
+            WHERE fingerprint IS NOT NULL;
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS imports (
+                sha256 TEXT PRIMARY KEY,
+                filename TEXT,
+                rows INTEGER NOT NULL,
+                inserted INTEGER NOT NULL,
+                imported TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        ''',
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+'''Returns the schema version recorded in the database file'''
+def get_schema_version(connection):
+    return connection.execute('PRAGMA user_version;').fetchone()[0]
+
+'''Applies every migration newer than the recorded schema version and returns the new version.
+The version is re-read under a write lock so concurrent processes never apply a migration twice.'''
+def migrate(connection):
+    if get_schema_version(connection) >= SCHEMA_VERSION:
+        return get_schema_version(connection)
+
+    if connection.in_transaction:
+        connection.commit()
+    cursor = connection.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE;')
+        version = get_schema_version(connection)
+        for number, description, steps in MIGRATIONS:
+            if number <= version:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(connection)
+                else:
+                    cursor.execute(step)
+            cursor.execute(f'PRAGMA user_version = {int(number)};')
+            version = number
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return version
+
+'''The lookups issued by the query functions in database.py, with representative parameters'''
+QUERY_PLANS = {
+    "get_user": (GET_USER_SQL, ("user1",)),
+    "get_user_accounts": (GET_USER_ACCOUNTS_SQL, (1,)),
+    "get_account_transactions": (GET_ACCOUNT_TRANSACTIONS_SQL, ("ACC00002",)),
+    "get_user_transactions": (user_transactions_sql(["accounts.userid = ?"]), (1, 100)),
+    "get_user_transactions_page": (
+        user_transactions_sql(["accounts.userid = ?", "(transactions.time, transactions.id) > (?, ?)"]),
+        (1, "2023-01-01 00:00:00", 0, 101),
+    ),
+    "get_transactions_in_time": (GET_TRANSACTIONS_IN_TIME_SQL, ("ACC00002", "2023-01-01 00:00:00", "2023-02-01 00:00:00")),
+    "get_category_transactions": (GET_CATEGORY_TRANSACTIONS_SQL, ("ACC00002", "dining")),
+    "get_expenses_per_category": (GET_EXPENSES_PER_CATEGORY_SQL, ("ACC00002",)),
+    "get_spending_by_category": (GET_SPENDING_BY_CATEGORY_SQL, ("2023-01-01", "2023-01-01", "2023-01-01", "2023-01-01", 1, "2022-12-01", "2023-02-01")),
+}
+
+_FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+'''Runs EXPLAIN QUERY PLAN for each entry in QUERY_PLANS and returns {name: (uses_index, plan)}.
+A query uses an index when some step searches an index and no step is a bare table scan.'''
+def check_query_plans(connection, queries=QUERY_PLANS):
+    results = {}
+    for name, (sql, params) in queries.items():
+        plan = [row[3] for row in connection.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+        uses_index = any('USING' in step for step in plan) and not any(_FULL_SCAN.match(step) for step in plan)
+        results[name] = (uses_index, plan)
+    return results
+
+if __name__ == "__main__":
+    import sqlite3
+    import sys
+
+    connection = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else "finance.db")
+    print(f"schema version {migrate(connection)}")
+    failed = False
+    for name, (uses_index, plan) in check_query_plans(connection).items():
+        print(f"{'ok  ' if uses_index else 'SCAN'} {name}: {'; '.join(plan)}")
+        failed = failed or not uses_index
+    connection.close()
+    sys.exit(1 if failed else 0)
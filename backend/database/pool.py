@@ -0,0 +1,131 @@
+from collections import deque
+from contextlib import contextmanager
+import sqlite3
+import threading
+
+'''Pragmas applied to every pooled connection. WAL lets readers carry on while a write is in
+progress, and synchronous=NORMAL only fsyncs at checkpoints, which is safe in WAL mode.'''
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+}
+
+'''Raised when no connection was free within the timeout'''
+class PoolExhaustedError(TimeoutError):
+    pass
+
+'''Hands out reusable SQLite connections: up to <readers> query-only connections shared by
+request handlers, and a single write connection guarded by a lock, since SQLite only ever
+allows one writer. Connections are opened lazily so the pool is safe to create before forking.
+Waiting readers are served strictly in arrival order: a released connection is handed straight
+to the longest waiting thread, so a thread that releases and re-acquires cannot jump the queue.'''
+class ConnectionPool:
+    def __init__(self, path, readers=8, pragmas=None, factory=sqlite3.Connection):
+        self.path = path
+        self.max_readers = readers
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.factory = factory
+        self._idle_readers = deque()
+        self._waiters = deque()
+        self._reader_count = 0
+        self._count_lock = threading.Lock()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    '''Opens a connection and applies the pool pragmas'''
+    def _connect(self, readonly):
+        timeout = self.pragmas.get("busy_timeout", 5000) / 1000
+        connection = sqlite3.connect(self.path, timeout=timeout, check_same_thread=False, factory=self.factory)
+        for name, value in self.pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value};')
+        if readonly:
+            connection.execute('PRAGMA query_only = ON;')
+        return connection
+
+    '''Returns an idle read connection, opening a new one if the pool is not yet full,
+    otherwise waiting up to <timeout> seconds for one to be handed over'''
+    def acquire_reader(self, timeout=30):
+        with self._count_lock:
+            if self._idle_readers and not self._waiters:
+                return self._idle_readers.pop()
+            create = self._reader_count < self.max_readers
+            if create:
+                self._reader_count += 1
+            else:
+                waiter = [threading.Event(), None]
+                self._waiters.append(waiter)
+        if create:
+            try:
+                return self._connect(readonly=True)
+            except Exception:
+                with self._count_lock:
+                    self._reader_count -= 1
+                raise
+        waiter[0].wait(timeout)
+        with self._count_lock:
+            if waiter[1] is None:
+                self._waiters.remove(waiter)
+                raise PoolExhaustedError(f"No database connection free after {timeout} seconds")
+        return waiter[1]
+
+    def release_reader(self, connection):
+        if connection.in_transaction:
+            connection.rollback()
+        with self._count_lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter[1] = connection
+                waiter[0].set()
+            else:
+                self._idle_readers.append(connection)
+
+    '''Takes the write lock and returns the shared write connection'''
+    def acquire_writer(self, timeout=30):
+        if not self._writer_lock.acquire(timeout=timeout):
+            raise PoolExhaustedError("Timed out waiting for the database write connection")
+        try:
+            if self._writer is None:
+                self._writer = self._connect(readonly=False)
+        except Exception:
+            self._writer_lock.release()
+            raise
+        return self._writer
+
+    '''Rolls back anything left uncommitted and releases the write lock'''
+    def release_writer(self, connection):
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        finally:
+            self._writer_lock.release()
+
+    @contextmanager
+    def reader(self):
+        connection = self.acquire_reader()
+        try:
+            yield connection
+        finally:
+            self.release_reader(connection)
+
+    @contextmanager
+    def writer(self):
+        connection = self.acquire_writer()
+        try:
+            yield connection
+        finally:
+            self.release_writer(connection)
+
+    '''Closes every idle connection'''
+    def close(self):
+        with self._count_lock:
+            while self._idle_readers:
+                self._idle_readers.pop().close()
+                self._reader_count -= 1
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
@@ -0,0 +1,69 @@
+'''SQL of the lookups in database.py, shared with the query plan check in migrations.py so the
+plans checked are those of the queries the app actually runs.'''
+
+# Columns of a transaction returned to callers; internal columns such as the dedupe
+# fingerprint are left out
+TRANSACTION_COLUMNS = "transactions.id, transactions.accountno, transactions.ref, transactions.val, transactions.time, transactions.category"
+
+GET_USER_SQL = '''
+    SELECT id, username, email, password
+    FROM users
+    WHERE username = ?;
+'''
+
+GET_USER_ACCOUNTS_SQL = '''
+    SELECT *
+    FROM accounts
+    WHERE userid = ?;
+'''
+
+GET_ACCOUNT_TRANSACTIONS_SQL = f'''
+    SELECT {TRANSACTION_COLUMNS}
+    FROM transactions
+    WHERE accountno = ?;
+'''
+
+GET_TRANSACTIONS_IN_TIME_SQL = '''
+    SELECT COALESCE(SUM(val), 0) as Expense
+    FROM transactions
+    WHERE accountno = ? and time >= ? and time < ?;
+'''
+
+GET_CATEGORY_TRANSACTIONS_SQL = '''
+    SELECT ref as Item, val as Expense, time as Time
+    FROM transactions
+    WHERE accountno = ? and category = ?;
+'''
+
+GET_EXPENSES_PER_CATEGORY_SQL = '''
+    SELECT category, SUM(val) as Expense
+    FROM transactions
+    WHERE accountno = ?
+    GROUP BY category
+    ORDER BY Expense DESC;
+'''
+
+GET_SPENDING_BY_CATEGORY_SQL = '''
+    SELECT NULLIF(totals.category, '') AS category,
+        COALESCE(SUM(CASE WHEN totals.day >= date(?) THEN totals.total END), 0) AS total,
+        COALESCE(SUM(CASE WHEN totals.day >= date(?) THEN totals.count END), 0) AS count,
+        COALESCE(SUM(CASE WHEN totals.day < date(?) THEN totals.total END), 0) AS previous_total,
+        COALESCE(SUM(CASE WHEN totals.day < date(?) THEN totals.count END), 0) AS previous_count
+    FROM accounts
+    JOIN daily_account_category_totals AS totals ON totals.accountno = accounts.accountno
+    WHERE accounts.userid = ? AND totals.day >= date(?) AND totals.day < date(?)
+    GROUP BY totals.category
+    ORDER BY total DESC;
+'''
+
+'''A user's transactions in (time, id) order, filtered by <clauses> (ANDed, the first being
+the userid) and limited by a final LIMIT parameter'''
+def user_transactions_sql(clauses):
+    return f'''
+        SELECT {TRANSACTION_COLUMNS}
+        FROM accounts
+        JOIN transactions ON transactions.accountno = accounts.accountno
+        WHERE {" AND ".join(clauses)}
+        ORDER BY transactions.time, transactions.id
+        LIMIT ?;
+    '''
@@ -0,0 +1,232 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from dateutil.relativedelta import relativedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formataddr
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from database import get_digest_recipients, get_digest_totals
+import os
+import smtplib
+import time
+
+# SMTP server the digest is sent through. Run stub_smtp.py and point these at it to see the
+# messages locally instead of sending them.
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 25))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS") == "1"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
+DIGEST_SENDER = os.getenv("DIGEST_SENDER", "Nikita.Pelagecha@warwick.ac.uk")
+DIGEST_SUBJECT = os.getenv("DIGEST_SUBJECT", "Your weekly spending summary")
+# Digests rendered and sent per batch; job progress is reported after every batch
+DIGEST_BATCH_SIZE = int(os.getenv("DIGEST_BATCH_SIZE", 100))
+
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_NAME = "email_template.html"
+
+_template = None
+
+
+# Compiles email_template.html once per process and keeps the compiled template
+def get_template():
+    global _template
+    if _template is None:
+        environment = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape(["html"]), auto_reload=False)
+        _template = environment.get_template(TEMPLATE_NAME)
+    return _template
+
+
+# Percentage change from previous to current, or None when there is nothing to compare against
+def percent_change(current, previous):
+    if not previous:
+        return None
+    return (current - previous) / abs(previous) * 100
+
+
+def describe_change(change):
+    return "n/a" if change is None else f"{change:+.1f}"
+
+
+# Category with the largest total among those with transactions in the period
+def top_category(rows):
+    return next((category for category, total, count in sorted(rows, key=lambda row: row[1], reverse=True) if count), None)
+
+
+# Returns one dict per user with an email address, holding the weekly and monthly totals, the
+# change against the previous week and month, and the top category of each. The periods end
+# on <day> (exclusive); "active" is false for users without transactions in the last two
+# months. All users are read in two queries, or just <userid> when given.
+def collect_digests(connection, day, userid=None):
+    windows = (day - timedelta(weeks=2), day - timedelta(weeks=1), day - relativedelta(months=2), day - relativedelta(months=1), day)
+    by_user = defaultdict(list)
+    for row in get_digest_totals(connection, *(bound.isoformat() for bound in windows), userid=userid):
+        by_user[row[0]].append(row)
+
+    digests = []
+    for user, username, email in get_digest_recipients(connection, userid):
+        rows = by_user.get(user, [])
+        week_total = sum(row[2] for row in rows)
+        month_total = sum(row[5] for row in rows)
+        digests.append({
+            "userid": user,
+            "username": username,
+            "email": email,
+            "active": bool(rows),
+            "week_total": week_total,
+            "week_count": sum(row[3] for row in rows),
+            "week_change": percent_change(week_total, sum(row[4] for row in rows)),
+            "week_category": top_category([(row[1], row[2], row[3]) for row in rows]),
+            "month_total": month_total,
+            "month_count": sum(row[6] for row in rows),
+            "month_change": percent_change(month_total, sum(row[7] for row in rows)),
+            "month_category": top_category([(row[1], row[5], row[6]) for row in rows]),
+        })
+    return digests
+
+
+# Renders a digest into the html body of the email
+def render_digest(digest):
+    return get_template().render(
+        username=digest["username"],
+        expensethisweek=f"{digest['week_total']:.2f}",
+        percentexpensemore=describe_change(digest["week_change"]),
+        expensethisweekcategory=digest["week_category"] or "none",
+        expensethismonth=f"{digest['month_total']:.2f}",
+        percentexpensemoremonth=describe_change(digest["month_change"]),
+        expensethismonthcategory=digest["month_category"] or "none",
+    )
+
+
+# The legacy MIME classes build and serialise a message several times faster than EmailMessage
+def build_message(digest, html, sender=DIGEST_SENDER, subject=DIGEST_SUBJECT):
+    message = MIMEMultipart("alternative")
+    message["Subject"] = subject
+    message["From"] = formataddr(("NOREPLY", sender))
+    message["To"] = digest["email"]
+    message.attach(MIMEText(
+        f"Hi {digest['username']}, you spent {digest['week_total']:.2f} this week ({describe_change(digest['week_change'])}% on last week) "
+        f"and {digest['month_total']:.2f} this month ({describe_change(digest['month_change'])}% on last month).", "plain", "utf-8"))
+    message.attach(MIMEText(html, "html", "utf-8"))
+    return message
+
+
+# One SMTP connection reused for every message. A connection the server dropped (many servers
+# cap messages per connection) is reopened once before the message counts as failed.
+class DigestMailer:
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, username=SMTP_USERNAME, password=SMTP_PASSWORD, starttls=SMTP_STARTTLS, timeout=SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.connections = 0
+        self._smtp = None
+
+    def connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        self._smtp = smtp
+        self.connections += 1
+
+    def send(self, message):
+        if self._smtp is None:
+            self.connect()
+        try:
+            self._smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            self._smtp = None
+            self.connect()
+            self._smtp.send_message(message)
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except smtplib.SMTPException:
+                self._smtp.close()
+            self._smtp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Sends the digest to every user, <batch_size> rendered messages at a time over one SMTP
+# connection, and returns counts and timings. Users with no transactions in the last two months
+# are skipped. <progress> is called with the fraction done after each batch.
+def send_digests(connection, day=None, batch_size=DIGEST_BATCH_SIZE, mailer=None, dry_run=False, progress=None):
+    day = date.fromisoformat(day) if isinstance(day, str) else day or date.today()
+    stats = {"date": day.isoformat(), "users": 0, "sent": 0, "failed": 0, "skipped": 0, "connections": 0}
+
+    start = time.perf_counter()
+    digests = collect_digests(connection, day)
+    stats["query_seconds"] = time.perf_counter() - start
+    stats["users"] = len(digests)
+    active = [digest for digest in digests if digest["active"]]
+    stats["skipped"] = len(digests) - len(active)
+
+    render_seconds = send_seconds = 0.0
+    owns_mailer = mailer is None and not dry_run
+    mailer = DigestMailer() if owns_mailer else mailer
+    try:
+        for offset in range(0, len(active), batch_size):
+            started = time.perf_counter()
+            batch = [build_message(digest, render_digest(digest)) for digest in active[offset:offset + batch_size]]
+            render_seconds += time.perf_counter() - started
+
+            started = time.perf_counter()
+            for message in batch:
+                if dry_run:
+                    continue
+                try:
+                    mailer.send(message)
+                    stats["sent"] += 1
+                except (smtplib.SMTPException, OSError):
+                    stats["failed"] += 1
+            send_seconds += time.perf_counter() - started
+            if progress is not None:
+                progress(min(1.0, (offset + batch_size) / len(active)))
+    finally:
+        if owns_mailer:
+            mailer.close()
+
+    stats["connections"] = mailer.connections if mailer is not None else 0
+    stats["render_seconds"] = render_seconds
+    stats["send_seconds"] = send_seconds
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from database import bootstrap_db, create_connection
+
+    parser = argparse.ArgumentParser(description="Send the weekly and monthly spending digest to every user")
+    parser.add_argument("--database", default=os.getenv("WHACK_DATABASE", os.path.join("database", "finance.db")))
+    parser.add_argument("--date", default=None, help="day the digest periods end on (exclusive), YYYY-MM-DD; defaults to today")
+    parser.add_argument("--batch-size", type=int, default=DIGEST_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="render every digest without sending it")
+    parser.add_argument("--enqueue", action="store_true", help="queue a send_digests job for the background workers instead")
+    args = parser.parse_args()
+
+    db = create_connection(args.database)
+    try:
+        bootstrap_db(db)
+        if args.enqueue:
+            from jobs import enqueue_job
+
+            # A single attempt: a retry would email the users the failed run already reached
+            print(f"Queued job {enqueue_job(db, 'send_digests', {'date': args.date}, max_attempts=1)}")
+        else:
+            print(json.dumps(send_digests(db, args.date, args.batch_size, dry_run=args.dry_run), indent=2))
+    finally:
+        db.close()
@@ -1,6 +1,6 @@
-from openai import OpenAI
-from dotenv import load_dotenv
-import os
+from llm_client import get_llm_client
+from llm_cache import completion_key, get_completion_cache
+import json
 
 # def run_rag(query, connection, accountno):
 #     try:
@@ -23,40 +23,66 @@ import os
 
 
 
-def run_model(type, query):
-    try:
-        load_dotenv()
-        api_key = os.getenv("OPENAI_API_KEY")
-        client = OpenAI(api_key=api_key)
-    except:
-        return "provide an API key in .env"
+CHAT_PROMPT = "You are a knowledgeable and friendly financial assistant. Your role is to provide clear, accurate, and helpful financial guidance. You aim to help users understand financial concepts, answer questions on personal finance topics (like budgeting, saving, investing, and debt management), and offer tips for financial wellness. Always prioritize accuracy and avoid making any guarantees, giving specific investment advice, or suggesting risky financial actions. Be supportive, respectful, and encourage users to seek professional advice when needed. Do not exceed 500 characters in your response. Tell the user you will not answer questions unrelated to helping them understand their account if their question isn't. If the query includes database information, base your response off this."
+IMAGE_PROMPT = "You will be given a stream of text from an image related to finances. You are to find the final sum total expense. Include only this numeric value in your response. You are not allowed to have text in your response."
+
+# Model and system prompt for each type of query
+MODELS = {
+    "chat": ("gpt-3.5-turbo", CHAT_PROMPT),
+    "image": ("gpt-4o-mini", IMAGE_PROMPT),
+}
+
+# Builds the model name and message list for a query, with any earlier conversation
+# (a list of {"role", "content"} messages) between the system prompt and the query
+def build_messages(type, query, history=None):
+    model, system_prompt = MODELS[type]
+    return model, [
+        {"role": "system", "content": system_prompt},
+        *(history or []),
+        {"role": "user", "content": f"{query}"}
+    ]
 
-    if type == "chat":
-        completion = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a knowledgeable and friendly financial assistant. Your role is to provide clear, accurate, and helpful financial guidance. You aim to help users understand financial concepts, answer questions on personal finance topics (like budgeting, saving, investing, and debt management), and offer tips for financial wellness. Always prioritize accuracy and avoid making any guarantees, giving specific investment advice, or suggesting risky financial actions. Be supportive, respectful, and encourage users to seek professional advice when needed. Do not exceed 500 characters in your response. Tell the user you will not answer questions unrelated to helping them understand their account if their question isn't. If the query includes database information, base your response off this."},
-                {
-                    "role": "user",
-                    "content": f"{query}"
-                }
-            ]
-        )
-        return completion.choices[0].message.content
-    elif type == "image":
-        completion = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You will be given a stream of text from an image related to finances. You are to find the final sum total expense. Include only this numeric value in your response. You are not allowed to have text in your response."},
-                {"role": "user", "content": f"{query}"}
-            ],
-        )
-        return completion.choices[0].message.content
-
-    else:
+# Cache key covering everything sent to the model
+def message_key(type, model, messages, query):
+    context = json.dumps(messages[:-1])
+    return completion_key(type, model, context, query)
+
+def run_model(type, query, history=None):
+    if type not in MODELS:
         return "incorrect 'type' argument provided. enter 'chat' or TBD"
+    client = get_llm_client()
+    if not client.api_key:
+        return "provide an API key in .env"
+
+    model, messages = build_messages(type, query, history)
+    key = message_key(type, model, messages, query)
+    return get_completion_cache().get_or_compute(key, lambda: client.complete_sync(messages, model))
+
+# Same as run_model, but yields the response in pieces as the API streams it
+def stream_model(type, query, history=None):
+    if type not in MODELS:
+        yield "incorrect 'type' argument provided. enter 'chat' or TBD"
+        return
+    client = get_llm_client()
+    if not client.api_key:
+        yield "provide an API key in .env"
+        return
+
+    model, messages = build_messages(type, query, history)
+    cache = get_completion_cache()
+    key = message_key(type, model, messages, query)
+    cached = cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    pieces = []
+    for piece in client.stream_sync(messages, model):
+        pieces.append(piece)
+        yield piece
+    cache.put(key, "".join(pieces))
 
 if __name__ == "__main__":
     # print("provide a query")
     # print(run_model("chat", input()))
-    print(run_model("image", "./sample/receipt.png"))
\ No newline at end of file
+    print(run_model("image", "./sample/receipt.png"))
@@ -0,0 +1,257 @@
+from database import bootstrap_db
+from database.pool import ConnectionPool
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+# Default number of worker processes, seconds between polls of an empty queue, and how long a
+# job may run before it is assumed lost (its worker died) and handed to another worker
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 0.5))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", 600))
+# Seconds before the first retry of a failed job; doubled for every further attempt
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", 5))
+
+HANDLERS = {}
+
+
+# Registers a function as the handler for a kind of job. Handlers are called with a
+# JobContext and the job's payload and return a JSON-serialisable result.
+def job_handler(kind):
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+    return register
+
+
+'''Adds a job to the queue and returns its id'''
+def enqueue_job(connection, kind, payload, userid=None, max_attempts=3):
+    cursor = connection.cursor()
+    cursor.execute('''
+        INSERT INTO jobs (kind, payload, userid, max_attempts, created)
+        VALUES (?, ?, ?, ?, ?);
+    ''', (kind, json.dumps(payload), userid, max_attempts, time.time()))
+    job_id = cursor.lastrowid
+    connection.commit()
+    cursor.close()
+    return job_id
+
+'''Returns a job as a dict, or None'''
+def get_job(connection, job_id):
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT id, kind, userid, status, progress, attempts, max_attempts, result, error, created, started, finished, duration
+        FROM jobs
+        WHERE id = ?;
+    ''', (job_id,))
+    record = cursor.fetchone()
+    column_names = [description[0] for description in cursor.description]
+    cursor.close()
+    if record is None:
+        return None
+    job = dict(zip(column_names, record))
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+'''Atomically marks the oldest runnable job as running and returns (id, kind, payload, attempts, max_attempts), or None'''
+def claim_job(connection, worker):
+    now = time.time()
+    cursor = connection.cursor()
+    cursor.execute('''
+        UPDATE jobs
+        SET status = 'running', attempts = attempts + 1, progress = 0, worker = ?, started = ?
+        WHERE id = (
+            SELECT id
+            FROM jobs
+            WHERE status = 'queued' AND run_after <= ?
+            ORDER BY id
+            LIMIT 1
+        )
+        RETURNING id, kind, payload, attempts, max_attempts;
+    ''', (worker, now, now))
+    record = cursor.fetchone()
+    connection.commit()
+    cursor.close()
+    return record
+
+'''Records how far through a running job is, as a fraction between 0 and 1'''
+def set_job_progress(connection, job_id, progress):
+    cursor = connection.cursor()
+    cursor.execute('''
+        UPDATE jobs
+        SET progress = ?
+        WHERE id = ?;
+    ''', (progress, job_id))
+    connection.commit()
+    cursor.close()
+
+'''Marks a job as done with its result and timing'''
+def finish_job(connection, job_id, result):
+    now = time.time()
+    cursor = connection.cursor()
+    cursor.execute('''
+        UPDATE jobs
+        SET status = 'done', progress = 1, result = ?, error = NULL, finished = ?, duration = ? - started
+        WHERE id = ?;
+    ''', (json.dumps(result), now, now, job_id))
+    connection.commit()
+    cursor.close()
+
+'''Puts a failed job back on the queue with exponential backoff, or marks it failed once it is out of attempts'''
+def fail_job(connection, job_id, error, attempts, max_attempts):
+    now = time.time()
+    cursor = connection.cursor()
+    if attempts < max_attempts:
+        cursor.execute('''
+            UPDATE jobs
+            SET status = 'queued', error = ?, run_after = ?
+            WHERE id = ?;
+        ''', (error, now + JOB_RETRY_DELAY * 2 ** (attempts - 1), job_id))
+    else:
+        cursor.execute('''
+            UPDATE jobs
+            SET status = 'failed', error = ?, finished = ?, duration = ? - started
+            WHERE id = ?;
+        ''', (error, now, now, job_id))
+    connection.commit()
+    cursor.close()
+
+'''Requeues jobs that have been running for longer than <timeout> seconds, whose worker has presumably died'''
+def requeue_stale_jobs(connection, timeout=JOB_TIMEOUT):
+    cursor = connection.cursor()
+    cursor.execute('''
+        UPDATE jobs
+        SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+            error = 'timed out'
+        WHERE status = 'running' AND started < ?;
+    ''', (time.time() - timeout,))
+    count = cursor.rowcount
+    connection.commit()
+    cursor.close()
+    return count
+
+
+# Handed to job handlers so they can report progress
+class JobContext:
+    def __init__(self, connection, job_id, attempt):
+        self.connection = connection
+        self.job_id = job_id
+        self.attempt = attempt
+
+    def progress(self, fraction):
+        set_job_progress(self.connection, self.job_id, fraction)
+
+
+'''Claims and runs one job; returns False when the queue had nothing runnable'''
+def run_next_job(connection, worker):
+    claimed = claim_job(connection, worker)
+    if claimed is None:
+        return False
+    job_id, kind, payload, attempts, max_attempts = claimed
+    try:
+        handler = HANDLERS[kind]
+        result = handler(JobContext(connection, job_id, attempts), json.loads(payload))
+        finish_job(connection, job_id, result)
+    except Exception as e:
+        if connection.in_transaction:
+            connection.rollback()
+        fail_job(connection, job_id, f"{type(e).__name__}: {e}", attempts, max_attempts)
+    return True
+
+'''Processes jobs until <stop> is set, sleeping while the queue is empty'''
+def worker_loop(database_path, stop=None, poll_interval=JOB_POLL_INTERVAL):
+    stop = stop or threading.Event()
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    pool = ConnectionPool(database_path, readers=1)
+    connection = pool.acquire_writer()
+    last_sweep = 0
+    try:
+        bootstrap_db(connection)
+        while not stop.is_set():
+            if time.time() - last_sweep > JOB_TIMEOUT / 10:
+                requeue_stale_jobs(connection)
+                last_sweep = time.time()
+            if not run_next_job(connection, worker):
+                stop.wait(poll_interval)
+    finally:
+        pool.release_writer(connection)
+        pool.close()
+
+def _worker_process(database_path, poll_interval):
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    worker_loop(database_path, stop, poll_interval)
+
+'''Starts <concurrency> worker processes and waits for them; SIGINT/SIGTERM stops them after their current job'''
+def run_workers(database_path, concurrency=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL):
+    processes = [
+        multiprocessing.Process(target=_worker_process, args=(database_path, poll_interval), name=f"job-worker-{i}")
+        for i in range(concurrency)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+
+# Imports a csv statement saved by /upload, then deletes the file
+@job_handler("ingest_transactions")
+def ingest_transactions_job(context, payload):
+    from database import ingest_transaction_file
+
+    stats = ingest_transaction_file(context.connection, payload["path"])
+    if payload.get("delete", True):
+        os.remove(payload["path"])
+    return stats
+
+
+# Reads a receipt image, categorises it and asks the model for the total
+@job_handler("classify_receipt")
+def classify_receipt_job(context, payload):
+    from classifier import classify_item
+    from gpt import run_model
+    from ocr import get_ocr_service
+    from utils import RECEIPT_LABELS
+
+    started = time.perf_counter()
+    text = get_ocr_service().read_text(payload["path"])
+    ocr_seconds = time.perf_counter() - started
+    context.progress(0.4)
+
+    category = classify_item(text, RECEIPT_LABELS)
+    context.progress(0.7)
+
+    price = run_model("image", text)
+    if payload.get("delete", True):
+        os.remove(payload["path"])
+    return {"category": category, "price": price, "ocr_seconds": ocr_seconds}
+
+
+# Emails every user their weekly and monthly spending digest; queued by `python digest.py --enqueue`
+@job_handler("send_digests")
+def send_digests_job(context, payload):
+    from digest import send_digests
+
+    return send_digests(context.connection, payload.get("date"), progress=context.progress)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run background job workers")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS)
+    parser.add_argument("--database", default=os.getenv("WHACK_DATABASE", os.path.join("database", "finance.db")))
+    parser.add_argument("--poll-interval", type=float, default=JOB_POLL_INTERVAL)
+    args = parser.parse_args()
+    print(f"Starting {args.workers} job workers on {args.database}")
+    run_workers(args.database, args.workers, args.poll_interval)
@@ -0,0 +1,190 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'llm_cache.db')
+# Seconds a completion stays valid, and how many are kept in memory and on disk
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 24 * 60 * 60))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", 1000))
+LLM_CACHE_DISK_SIZE = int(os.getenv("LLM_CACHE_DISK_SIZE", 100000))
+# Disk tier housekeeping runs once every this many writes
+PRUNE_EVERY = 100
+
+
+# Collapses whitespace and case so trivially different phrasings of a query share an entry
+def normalise_query(query):
+    return " ".join(str(query).split()).casefold()
+
+
+# Cache key for a completion: the query type, model, system prompt and normalised query
+def completion_key(type, model, system_prompt, query):
+    payload = json.dumps([type, model, system_prompt, normalise_query(query)])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# Cache of LLM completions with a size-bounded in-memory LRU in front of a SQLite tier, both
+# expiring entries after a TTL. get_or_compute coalesces concurrent requests for the same key
+# so only one of them calls the API and the rest wait for its answer.
+class CompletionCache:
+    def __init__(self, path=CACHE_FILE, max_entries=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL, max_disk_entries=LLM_CACHE_DISK_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.coalesced = 0
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires REAL NOT NULL
+                );
+            ''')
+            connection.execute('''
+                CREATE INDEX IF NOT EXISTS idx_completions_expires
+                ON completions (expires);
+            ''')
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    '''Looks the key up in memory and then on disk; must be called holding the lock'''
+    def _lookup(self, key):
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._memory.move_to_end(key)
+                return entry[1]
+            del self._memory[key]
+
+        row = self._connect().execute('''
+            SELECT value, expires
+            FROM completions
+            WHERE key = ? AND expires > ?;
+        ''', (key, now)).fetchone()
+        if row is None:
+            return None
+        self.disk_hits += 1
+        self._remember(key, row[0], row[1])
+        return row[0]
+
+    def _remember(self, key, value, expires):
+        self._memory[key] = (expires, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            value = self._lookup(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key, value):
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, value, expires)
+            connection = self._connect()
+            connection.execute('''
+                INSERT OR REPLACE INTO completions (key, value, expires)
+                VALUES (?, ?, ?);
+            ''', (key, value, expires))
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                self._prune(connection)
+            connection.commit()
+
+    '''Drops expired rows and, past the disk limit, the rows closest to expiring'''
+    def _prune(self, connection):
+        connection.execute('DELETE FROM completions WHERE expires <= ?;', (time.time(),))
+        connection.execute('''
+            DELETE FROM completions
+            WHERE key IN (
+                SELECT key FROM completions
+                ORDER BY expires DESC
+                LIMIT -1 OFFSET ?
+            );
+        ''', (self.max_disk_entries,))
+
+    '''Returns the cached value for key, or calls compute() once for all concurrent callers and caches its result'''
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            pending = self._inflight.get(key)
+            leader = pending is None
+            if leader:
+                self.misses += 1
+                pending = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return pending.result()
+
+        try:
+            value = compute()
+            if value is not None:
+                self.put(key, value)
+            pending.set_result(value)
+            return value
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            connection = self._connect()
+            connection.execute('DELETE FROM completions;')
+            connection.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "disk_hits": self.disk_hits,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "inflight": len(self._inflight),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Returns the process-wide completion cache
+def get_completion_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CompletionCache()
+    return _cache
@@ -0,0 +1,158 @@
+from dotenv import load_dotenv
+from metrics import MODEL_LOAD_SECONDS, time_inference
+import asyncio
+import os
+import queue
+import threading
+
+load_dotenv()
+
+# Seconds to wait for a whole completion, for the connection, and for a free concurrency slot
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 10))
+# Completions allowed in flight at once, and pooled keep-alive connections to the API
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 32))
+
+
+# Raised when every concurrency slot stays busy for longer than the queue timeout
+class LLMBusyError(Exception):
+    pass
+
+
+_DONE = object()
+
+
+# Shared asynchronous OpenAI client. One event loop runs on a background thread and owns a
+# single AsyncOpenAI client over a pooled keep-alive HTTP connection pool, so every request
+# handler reuses the same connections instead of building a client per call. A semaphore
+# caps the number of completions in flight. The *_sync methods let Flask handlers use it.
+class AsyncLLMClient:
+    def __init__(self, base_url=None, api_key=None, timeout=LLM_TIMEOUT, connect_timeout=LLM_CONNECT_TIMEOUT,
+                 max_concurrency=LLM_MAX_CONCURRENCY, max_connections=LLM_MAX_CONNECTIONS, queue_timeout=LLM_QUEUE_TIMEOUT):
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.queue_timeout = queue_timeout
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+
+    '''Starts the event loop thread and creates the client on first use'''
+    def _ensure_started(self):
+        if self._loop is not None:
+            return self._loop
+        with self._lock:
+            if self._loop is None:
+                with MODEL_LOAD_SECONDS.time(model="llm"):
+                    loop = asyncio.new_event_loop()
+                    thread = threading.Thread(target=loop.run_forever, name="llm-client", daemon=True)
+                    thread.start()
+                    try:
+                        asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+                    except BaseException:
+                        # Stop the thread again, or every later call would leak another one
+                        loop.call_soon_threadsafe(loop.stop)
+                        thread.join()
+                        loop.close()
+                        raise
+                self._loop = loop
+        return self._loop
+
+    # openai and httpx are imported here, on first use, to keep them out of web process start-up
+    async def _setup(self):
+        from openai import AsyncOpenAI
+        import httpx
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+        )
+        self._client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, http_client=http_client, max_retries=1)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def _acquire_slot(self):
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise LLMBusyError("Too many chat requests in progress, try again shortly")
+
+    '''Returns the text of a single completion'''
+    async def complete(self, messages, model):
+        await self._acquire_slot()
+        try:
+            with time_inference("llm"):
+                completion = await self._client.chat.completions.create(model=model, messages=messages)
+            return completion.choices[0].message.content
+        finally:
+            self._semaphore.release()
+
+    '''Yields the completion text piece by piece as the API streams it back'''
+    async def stream(self, messages, model):
+        await self._acquire_slot()
+        try:
+            with time_inference("llm_stream"):
+                chunks = await self._client.chat.completions.create(model=model, messages=messages, stream=True)
+                async for chunk in chunks:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        finally:
+            self._semaphore.release()
+
+    def complete_sync(self, messages, model):
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self.complete(messages, model), loop).result(self.timeout + self.queue_timeout)
+
+    '''Blocking generator over stream(), fed through a thread-safe queue'''
+    def stream_sync(self, messages, model):
+        loop = self._ensure_started()
+        tokens = queue.Queue()
+
+        async def pump():
+            try:
+                async for token in self.stream(messages, model):
+                    tokens.put(token)
+            except Exception as e:
+                tokens.put(e)
+            finally:
+                tokens.put(_DONE)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), loop)
+        try:
+            while True:
+                token = tokens.get(timeout=self.timeout + self.queue_timeout)
+                if token is _DONE:
+                    break
+                if isinstance(token, Exception):
+                    raise token
+                yield token
+        finally:
+            future.cancel()
+
+    '''Closes the HTTP connection pool and stops the loop thread'''
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+            self._client = None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+# Returns the process-wide LLM client
+def get_llm_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AsyncLLMClient()
+    return _client
@@ -0,0 +1,201 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+import bisect
+import sqlite3
+import threading
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Upper bounds of the queries-per-request histogram buckets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+REGISTRY = []
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+# Monotonic counter with optional labels
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+# Cumulative histogram with optional labels, rendered in the Prometheus text format
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    '''Context manager observing the seconds spent inside it'''
+    @contextmanager
+    def time(self, **labels):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(bound))])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+# Returns every registered metric in the Prometheus text exposition format
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_SECONDS = Histogram("whack_http_request_duration_seconds", "Time to handle a request, including streaming the response", ["endpoint", "method", "status"])
+REQUEST_SQL_QUERIES = Histogram("whack_http_request_sql_queries", "SQL statements executed per request", ["endpoint"], QUERY_COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram("whack_http_request_sql_seconds", "Time spent in SQL per request", ["endpoint"])
+SQL_SECONDS = Histogram("whack_sql_query_duration_seconds", "Time to execute a SQL statement and fetch its rows", ["operation"])
+MODEL_LOAD_SECONDS = Histogram("whack_model_load_seconds", "Time to load a model or client", ["model"], LATENCY_BUCKETS + (120, 300))
+MODEL_INFERENCE_SECONDS = Histogram("whack_model_inference_seconds", "Time for one model call", ["model"])
+MODEL_ERRORS = Counter("whack_model_errors_total", "Model calls that raised", ["model"])
+
+
+# SQL statements and seconds spent in SQL by the current request
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+
+_request_stats = ContextVar("request_stats", default=None)
+
+
+# Starts counting SQL for a new request in this context and returns its stats
+def start_request_stats():
+    stats = RequestStats()
+    _request_stats.set(stats)
+    return stats
+
+
+def record_sql(operation, seconds, statements=1):
+    SQL_SECONDS.observe(seconds, operation=operation)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += statements
+        stats.sql_seconds += seconds
+
+
+def _operation(sql):
+    words = sql.split(None, 1)
+    return words[0].upper() if words else ""
+
+
+# Cursor recording how long each statement and fetch takes. Rows read by iterating over the
+# cursor are not timed, only fetchone/fetchmany/fetchall.
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._operation = _operation(sql)
+            record_sql(self._operation, perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._operation = _operation(sql)
+            record_sql(self._operation, perf_counter() - start)
+
+    def _timed_fetch(self, fetch, *args):
+        start = perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            record_sql(getattr(self, "_operation", ""), perf_counter() - start, statements=0)
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed_fetch(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+
+# Connection whose cursors, and shortcut execute calls, are instrumented; pass it as the
+# factory of a ConnectionPool or sqlite3.connect
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# Context manager timing one model call; failures are counted as well
+@contextmanager
+def time_inference(model):
+    start = perf_counter()
+    try:
+        yield
+    except BaseException:
+        MODEL_ERRORS.inc(model=model)
+        raise
+    finally:
+        MODEL_INFERENCE_SECONDS.observe(perf_counter() - start, model=model)
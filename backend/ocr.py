@@ -0,0 +1,167 @@
+from concurrent.futures import ProcessPoolExecutor
+from metrics import MODEL_LOAD_SECONDS, time_inference
+from time import perf_counter
+import os
+import threading
+
+# PIL, numpy and the OCR engines are imported inside the functions that use them, so
+# importing this module costs nothing until a receipt is actually read
+
+# OCR backend: "tesseract" (fast, CPU) or "easyocr" (neural, slower to load)
+OCR_ENGINE = os.getenv("OCR_ENGINE", "tesseract")
+# Receipts are downscaled to this resolution before recognition; images without DPI
+# information are capped at OCR_MAX_SIDE pixels on their longest side instead
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", 200))
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", 1600))
+# Worker processes used for batches of receipts
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+
+
+# Converts an image to grayscale and shrinks it to the target DPI (or maximum side length).
+# Recognition time grows with the pixel count, and receipts scanned at 300-600 DPI read just
+# as well at 200.
+def preprocess(image, target_dpi=OCR_TARGET_DPI, max_side=OCR_MAX_SIDE):
+    from PIL import Image
+    image = image.convert("L")
+    dpi = image.info.get("dpi")
+    if dpi and dpi[0] > target_dpi:
+        scale = target_dpi / float(dpi[0])
+    else:
+        scale = min(1.0, max_side / float(max(image.size)))
+    if scale < 1.0:
+        size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+        image = image.resize(size, Image.LANCZOS)
+    return image
+
+
+# Loads an image from a path (or takes an already opened image) and preprocesses it
+def load_image(source, target_dpi=OCR_TARGET_DPI, max_side=OCR_MAX_SIDE):
+    from PIL import Image
+    image = source if isinstance(source, Image.Image) else Image.open(source)
+    return preprocess(image, target_dpi, max_side)
+
+
+# Long-lived OCR engine. The easyocr reader is a model load, so it is created once on first
+# use and shared by every caller in the process.
+class OCRService:
+    def __init__(self, engine=OCR_ENGINE, languages=("en",), target_dpi=OCR_TARGET_DPI, max_side=OCR_MAX_SIDE):
+        self.engine = engine
+        self.languages = list(languages)
+        self.target_dpi = target_dpi
+        self.max_side = max_side
+        self._reader = None
+        self._lock = threading.Lock()
+
+    '''Returns the shared easyocr reader, loading it on first use'''
+    def easyocr_reader(self):
+        if self._reader is None:
+            with self._lock:
+                if self._reader is None:
+                    with MODEL_LOAD_SECONDS.time(model="easyocr"):
+                        import easyocr
+                        self._reader = easyocr.Reader(self.languages)
+        return self._reader
+
+    '''Loads whatever the configured engine needs, so the first request does not pay for it'''
+    def load(self):
+        if self.engine == "easyocr":
+            self.easyocr_reader()
+        return self
+
+    '''Returns easyocr's (box, text, confidence) detections for an image'''
+    def read_regions(self, source, **kwargs):
+        import numpy as np
+        image = load_image(source, self.target_dpi, self.max_side)
+        reader = self.easyocr_reader()
+        with time_inference("easyocr"):
+            return reader.readtext(np.array(image), **kwargs)
+
+    '''Returns the text in an image'''
+    def read_text(self, source):
+        image = load_image(source, self.target_dpi, self.max_side)
+        if self.engine == "easyocr":
+            import numpy as np
+            reader = self.easyocr_reader()
+            with time_inference("easyocr"):
+                return "\n".join(reader.readtext(np.array(image), detail=0, paragraph=True))
+        import pytesseract
+        with time_inference("tesseract"):
+            return pytesseract.image_to_string(image)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+# Returns the process-wide OCR service
+def get_ocr_service():
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = OCRService()
+    return _service
+
+
+# Runs in each pool process: builds and warms that process's OCR service
+def _init_worker(engine):
+    global _service
+    _service = OCRService(engine=engine).load()
+
+
+def _read_one(path, service=None):
+    start = perf_counter()
+    text = (service or get_ocr_service()).read_text(path)
+    return {"path": path, "text": text, "seconds": perf_counter() - start}
+
+
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+
+
+# Returns a process pool whose workers keep their OCR engine loaded between batches
+def get_ocr_pool(workers=OCR_WORKERS, engine=OCR_ENGINE):
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is None or _pool_key != (workers, engine):
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(engine,))
+            _pool_key = (workers, engine)
+        return _pool
+
+
+# Reads a batch of receipt images, spread across <workers> processes, and returns a
+# {"path", "text", "seconds"} dict for each path in order
+def read_receipts(paths, workers=OCR_WORKERS, engine=OCR_ENGINE):
+    paths = list(paths)
+    if workers <= 1 or len(paths) <= 1:
+        # Another engine gets a service of its own rather than replacing the process-wide one
+        service = get_ocr_service()
+        if engine != service.engine:
+            service = OCRService(engine=engine)
+        return [_read_one(path, service) for path in paths]
+    chunksize = max(1, len(paths) // (workers * 4))
+    return list(get_ocr_pool(workers, engine).map(_read_one, paths, chunksize=chunksize))
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure OCR throughput over a set of receipt images")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--workers", type=int, default=OCR_WORKERS)
+    parser.add_argument("--engine", default=OCR_ENGINE, choices=["tesseract", "easyocr"])
+    parser.add_argument("--repeat", type=int, default=1, help="process the paths this many times")
+    args = parser.parse_args()
+    paths = args.paths * args.repeat
+
+    for workers in sorted({1, args.workers}):
+        # Warm up first so the numbers exclude engine start-up
+        read_receipts(paths[:workers], workers, args.engine)
+        start = perf_counter()
+        results = read_receipts(paths, workers, args.engine)
+        elapsed = perf_counter() - start
+        per_image = sum(result["seconds"] for result in results) / len(results)
+        print(f"{args.engine}, {workers} worker(s): {len(paths)} receipts in {elapsed:.2f}s, "
+              f"{len(paths) / elapsed:.2f} receipts/s, {per_image * 1000:.0f} ms per receipt")
@@ -0,0 +1,189 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from werkzeug import security
+import os
+import threading
+import time
+
+# Hash method for new passwords, in werkzeug's format. Stored hashes made with other
+# parameters are upgraded the next time their user logs in, so the cost can be tuned
+# against the latency budget without invalidating anyone's password.
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+# Processes doing the hashing, how many hashes may be queued or running at once before new
+# requests are turned away, and how long a request waits for its hash
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", 2))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", 16))
+HASH_TIMEOUT = float(os.getenv("HASH_TIMEOUT", 5))
+# Login attempts allowed per client address, and failed attempts per username, within the window
+LOGIN_ATTEMPTS_PER_IP = int(os.getenv("LOGIN_ATTEMPTS_PER_IP", 20))
+LOGIN_FAILURES_PER_USER = int(os.getenv("LOGIN_FAILURES_PER_USER", 5))
+LOGIN_WINDOW = float(os.getenv("LOGIN_WINDOW", 60))
+
+
+# Raised when the hashing queue is full or a hash took too long
+class HasherBusyError(Exception):
+    pass
+
+
+# Returns the method part werkzeug writes into a hash made with <method>, expanding shorthands
+# such as "scrypt" or "pbkdf2:sha256" with werkzeug's defaults the way it does when hashing
+def method_prefix(method):
+    name, *args = method.split(":")
+    if name == "scrypt":
+        if not args:
+            args = [2**15, 8, 1]
+        if len(args) != 3:
+            raise ValueError("'scrypt' takes 3 arguments.")
+        n, r, p = map(int, args)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == "pbkdf2":
+        if len(args) > 2:
+            raise ValueError("'pbkdf2' takes 2 arguments.")
+        hash_name = args[0] if args else "sha256"
+        iterations = int(args[1]) if len(args) == 2 else security.DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    raise ValueError(f"Invalid hash method '{method}'.")
+
+
+# Runs password hashing and verification in a small process pool, so the ~100 ms of CPU and
+# 32 MB of memory each scrypt call costs never blocks a request thread or the GIL. At most
+# <queue_limit> calls are queued or running; past that callers get HasherBusyError at once
+# instead of waiting behind a burst of logins.
+class PasswordHasher:
+    def __init__(self, method=PASSWORD_HASH_METHOD, workers=HASH_WORKERS, queue_limit=HASH_QUEUE_LIMIT, timeout=HASH_TIMEOUT):
+        self.method = method
+        self.method_prefix = method_prefix(method)
+        self.workers = workers
+        self.timeout = timeout
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(queue_limit)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HasherBusyError("too many password checks in progress")
+        try:
+            future = self._pool().submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HasherBusyError("password check timed out")
+
+    def hash(self, password):
+        return self._run(security.generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(security.check_password_hash, pwhash, password)
+
+    '''Whether a stored hash was made with parameters other than the configured method'''
+    def needs_rehash(self, pwhash):
+        return pwhash.split("$", 1)[0] != self.method_prefix
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+# Sliding-window counter of events per key, e.g. login attempts per client address
+class RateLimiter:
+    def __init__(self, limit, window=LOGIN_WINDOW):
+        self.limit = limit
+        self.window = window
+        self._events = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def _recent(self, key, now):
+        events = self._events.get(key)
+        if events is None:
+            return None
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        if not events:
+            del self._events[key]
+            return None
+        return events
+
+    '''Seconds until <key> may act again, or 0 when it is under the limit'''
+    def retry_after(self, key):
+        now = time.monotonic()
+        with self._lock:
+            events = self._recent(key, now)
+            if events is None or len(events) < self.limit:
+                return 0
+            return events[0] + self.window - now
+
+    def hit(self, key):
+        now = time.monotonic()
+        with self._lock:
+            self._events.setdefault(key, deque()).append(now)
+            if now - self._last_sweep > self.window:
+                for stale in list(self._events):
+                    self._recent(stale, now)
+                self._last_sweep = now
+
+    def reset(self, key):
+        with self._lock:
+            self._events.pop(key, None)
+
+
+# Throttles logins: every attempt counts against the client address, and failed attempts
+# count against the username, so neither one address nor a guessing attack on one account
+# can keep the hashing pool busy
+class LoginThrottle:
+    def __init__(self, per_ip=LOGIN_ATTEMPTS_PER_IP, per_user=LOGIN_FAILURES_PER_USER, window=LOGIN_WINDOW):
+        self.addresses = RateLimiter(per_ip, window)
+        self.failures = RateLimiter(per_user, window)
+
+    '''Seconds the caller has to wait before trying again, or 0 when the attempt may go ahead'''
+    def check(self, address, username):
+        return max(self.addresses.retry_after(address), self.failures.retry_after(username))
+
+    def attempt(self, address):
+        self.addresses.hit(address)
+
+    def failed(self, username):
+        self.failures.hit(username)
+
+    def succeeded(self, username):
+        self.failures.reset(username)
+
+
+_hasher = None
+_throttle = None
+_singletons_lock = threading.Lock()
+
+
+# Returns the process-wide password hasher
+def get_password_hasher():
+    global _hasher
+    if _hasher is None:
+        with _singletons_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher()
+    return _hasher
+
+
+# Returns the process-wide login throttle
+def get_login_throttle():
+    global _throttle
+    if _throttle is None:
+        with _singletons_lock:
+            if _throttle is None:
+                _throttle = LoginThrottle()
+    return _throttle
@@ -0,0 +1,70 @@
+from database import get_account_balances
+import numpy as np
+
+# Interest rates are stored as annual percentages (1.18 means 1.18% a year) and interest is
+# compounded monthly
+MONTHS_PER_YEAR = 12
+# Longest projection the endpoint will compute, in months
+MAX_HORIZON = 600
+
+
+# Loads one user's accounts (or every account when userid is None) into arrays:
+# (account numbers, user ids, balances, annual rates in percent)
+def load_accounts(connection, userid=None):
+    rows = get_account_balances(connection, userid)
+    accountnos = [row[0] for row in rows]
+    userids = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    balances = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+    rates = np.fromiter((row[3] for row in rows), dtype=np.float64, count=len(rows))
+    return accountnos, userids, balances, rates
+
+
+# Returns the month offsets 0, step, 2*step, ... up to and including <horizon>
+def horizons(horizon, step=1):
+    months = np.arange(0, horizon + 1, step, dtype=np.float64)
+    if months[-1] != horizon:
+        months = np.append(months, horizon)
+    return months
+
+
+# Projects every balance over every horizon in one pass. Returns an array of shape
+# (accounts, horizons) where [i, j] is balance i after months[j] months of monthly
+# compounding at annual rate i (in percent).
+def project_balances(balances, rates, months):
+    monthly_growth = np.log1p(np.asarray(rates, dtype=np.float64) / (100.0 * MONTHS_PER_YEAR))
+    return np.asarray(balances, dtype=np.float64)[:, None] * np.exp(monthly_growth[:, None] * np.asarray(months, dtype=np.float64)[None, :])
+
+
+# Sums projected balances per user. Returns (distinct user ids, array of shape (users, horizons)).
+# Rows already grouped by user, as load_accounts returns them, are summed in place.
+def totals_by_user(userids, projections):
+    userids = np.asarray(userids)
+    if not len(userids):
+        return userids, np.zeros((0, projections.shape[1]))
+    if np.any(userids[1:] < userids[:-1]):
+        order = np.argsort(userids, kind="stable")
+        userids, projections = userids[order], projections[order]
+    starts = np.flatnonzero(np.r_[True, userids[1:] != userids[:-1]])
+    return userids[starts], np.add.reduceat(projections, starts, axis=0)
+
+
+# Projects a user's accounts over the given months, as a JSON-ready dict with each account's
+# projected balances and the user's total for each horizon
+def project_user(connection, userid, months):
+    accountnos, _, balances, rates = load_accounts(connection, userid)
+    projections = project_balances(balances, rates, months)
+    return {
+        "months": months.astype(int).tolist(),
+        "accounts": [
+            {"accountno": accountno, "interest_rate": float(rate), "balances": np.round(row, 2).tolist()}
+            for accountno, rate, row in zip(accountnos, rates, projections)
+        ],
+        "total": np.round(projections.sum(axis=0), 2).tolist(),
+    }
+
+
+# Projects every user's total balance over the given months. Returns {userid: [totals]}.
+def project_all_users(connection, months):
+    _, userids, balances, rates = load_accounts(connection)
+    users, totals = totals_by_user(userids, project_balances(balances, rates, months))
+    return {int(user): np.round(row, 2).tolist() for user, row in zip(users, totals)}
@@ -1,13 +1,12 @@
-import easyocr
-from PIL import Image
-import pytesseract
+from ocr import get_ocr_service
 import re
 
 def read_receipt(prices,  items):
-    reader = easyocr.Reader(['en'])
+    # Shared, already loaded reader; images are grayscaled and downscaled before reading
+    service = get_ocr_service()
 
-    result = reader.readtext(prices, allowlist = '.0123456789')
-    result2 = reader.readtext(items)
+    result = service.read_regions(prices, allowlist = '.0123456789')
+    result2 = service.read_regions(items)
 
     prices = []
 
@@ -41,10 +40,8 @@ def read_receipt(prices,  items):
     return prices
 
 def readReceipt2(path):
-    image = Image.open(path)
-
-    # Extract text using Tesseract
-    text = pytesseract.image_to_string(image)
+    # Extract text using the shared OCR service
+    text = get_ocr_service().read_text(path)
 
     # Print the extracted text
     print("Extracted Text:\n", text)
@@ -0,0 +1,104 @@
+from database import get_latest_activity_day, get_latest_transaction_id, get_large_transactions, get_spending_by_category, get_spending_buckets, search_transactions
+from datetime import date, timedelta
+import os
+import re
+import threading
+import time
+
+# How long a user's precomputed summary is reused before it is rebuilt from the aggregates
+CONTEXT_TTL = float(os.getenv("CHAT_FACTS_TTL", 300))
+# Number of search matches added to the summary for each chat message
+CONTEXT_MATCHES = int(os.getenv("CHAT_FACTS_MATCHES", 5))
+
+# Words that carry no meaning for a transaction search
+STOPWORDS = {
+    "a", "about", "all", "am", "an", "and", "any", "are", "as", "at", "be", "been", "by", "can", "did", "do", "does",
+    "for", "from", "get", "got", "had", "has", "have", "how", "i", "in", "is", "it", "last", "me", "money", "much",
+    "my", "of", "on", "or", "so", "spend", "spending", "spent", "that", "the", "this", "to", "was", "what", "when",
+    "where", "which", "who", "why", "with", "you", "your",
+}
+
+_summaries = {}
+_summaries_lock = threading.Lock()
+
+
+# Builds the compact, query-independent facts about a user's finances from the aggregates:
+# category totals and monthly totals over the last three months of activity, and the largest
+# recent transactions. Dates are relative to the user's latest activity.
+def compute_user_summary(connection, userid):
+    latest = get_latest_activity_day(connection, userid)
+    if latest is None:
+        return ["The user has no transactions yet."]
+
+    end = date.fromisoformat(latest) + timedelta(days=1)
+    start = end - timedelta(days=90)
+    previous_start = start - timedelta(days=90)
+    facts = [f"Latest transaction on {latest}."]
+
+    categories = get_spending_by_category(connection, userid, previous_start.isoformat(), start.isoformat(), end.isoformat())
+    current = [(category, total, count) for category, total, count, _, _ in categories if count]
+    if current:
+        facts.append("Totals by category over the last 90 days: " + ", ".join(
+            f"{category or 'uncategorised'} {total:.2f} ({count} transactions)" for category, total, count in current))
+        total = sum(row[1] for row in categories)
+        previous = sum(row[3] for row in categories)
+        facts.append(f"Net total over the last 90 days {total:.2f}, against {previous:.2f} in the 90 days before.")
+
+    months = get_spending_buckets(connection, userid, (end - timedelta(days=180)).isoformat(), end.isoformat(), "month")
+    if months:
+        facts.append("Monthly totals: " + ", ".join(f"{period} {total:.2f}" for period, total, _ in months))
+
+    large = get_large_transactions(connection, userid, (end - timedelta(days=30)).isoformat())
+    if large:
+        facts.append("Largest transactions in the last 30 days: " + ", ".join(
+            f"{ref} ({category}) {val:.2f} on {str(time)[:10]}" for time, ref, category, val, _ in large))
+    return facts
+
+
+# Returns the user's precomputed summary facts, rebuilding them once they are older than the TTL
+# or once transactions were added since they were built. Imports run in the job workers, not
+# in this process, so new data is spotted from the newest transaction id, a single lookup.
+def get_user_summary(connection, userid):
+    now = time.monotonic()
+    latest = get_latest_transaction_id(connection)
+    with _summaries_lock:
+        cached = _summaries.get(userid)
+    if cached and cached[0] > now and cached[1] == latest:
+        return cached[2]
+    facts = compute_user_summary(connection, userid)
+    with _summaries_lock:
+        _summaries[userid] = (now + CONTEXT_TTL, latest, facts)
+    return facts
+
+
+# Drops a user's cached summary, e.g. after new transactions were imported
+def invalidate_user_summary(userid=None):
+    with _summaries_lock:
+        if userid is None:
+            _summaries.clear()
+        else:
+            _summaries.pop(userid, None)
+
+
+# Turns a chat message into an FTS5 expression matching any of its meaningful words as prefixes
+def build_match(query):
+    words = [word for word in re.findall(r"[a-z0-9]+", query.lower()) if word not in STOPWORDS and len(word) > 1]
+    return " OR ".join(f'"{word}"*' for word in dict.fromkeys(words))
+
+
+# Returns the transactions most relevant to the message, as fact sentences
+def search_facts(connection, userid, query, limit=CONTEXT_MATCHES):
+    match = build_match(query)
+    if not match:
+        return []
+    return [
+        f"'{ref}' ({category}): {count} transactions totalling {total:.2f}, latest on {str(latest)[:10]}."
+        for ref, category, count, total, latest in search_transactions(connection, userid, match, limit)
+    ]
+
+
+# System message with the facts about the user's accounts relevant to <query>, kept to a
+# bounded size: the cached summary plus the top matches from the full-text index
+def build_financial_context(connection, userid, query, limit=CONTEXT_MATCHES):
+    facts = get_user_summary(connection, userid) + search_facts(connection, userid, query, limit)
+    return {"role": "system", "content": "Information from the user's accounts:\n" + "\n".join(f"- {fact}" for fact in facts)}
@@ -0,0 +1,100 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import threading
+import time
+
+# Local stand-in for the OpenAI chat completions API, for tests and load tests.
+# Point the backend at it with
+#   OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub python app.py
+# It answers every request after <latency> seconds, echoing the last user message, and
+# streams the reply word by word (<token_delay> seconds apart) when asked to stream.
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply_text(self, request):
+        messages = request.get("messages", [])
+        query = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        return self.server.reply or f"Stub reply to: {query}"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+
+        self.server.requests += 1
+        time.sleep(self.server.latency)
+        text = self._reply_text(request)
+        model = request.get("model", "stub")
+        created = int(time.time())
+
+        if request.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            words = text.split(" ")
+            for i, word in enumerate(words):
+                piece = word if i == 0 else " " + word
+                chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+                time.sleep(self.server.token_delay)
+            self._write_chunk("data: [DONE]\n\n")
+            self._write_chunk("")
+            return
+
+        body = json.dumps({
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+# Starts the stub on a background thread and returns the server; its base_url attribute is
+# what OPENAI_BASE_URL should be set to. Port 0 picks a free port.
+def start_stub_server(host="127.0.0.1", port=0, latency=0.0, token_delay=0.0, reply=None):
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.token_delay = token_delay
+    server.reply = reply
+    server.requests = 0
+    server.base_url = f"http://{host}:{server.server_address[1]}/v1"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stub of the OpenAI chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each response starts")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed tokens")
+    parser.add_argument("--reply", default=None, help="fixed reply text instead of echoing the query")
+    args = parser.parse_args()
+    server = start_stub_server(args.host, args.port, args.latency, args.token_delay, args.reply)
+    print(f"Stub OpenAI API listening on {server.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
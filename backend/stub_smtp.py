@@ -0,0 +1,100 @@
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+import argparse
+import threading
+
+# Local debugging SMTP server, for tests and for trying out the email digest.
+# Point the digest at it with
+#   SMTP_HOST=127.0.0.1 SMTP_PORT=8025 python digest.py
+# It accepts every message and keeps (sender, recipients, raw message) in its messages list,
+# printing a one-line summary of each when run from the command line.
+
+
+class StubSMTPHandler(StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def read_data(self):
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line.rstrip(b"\r\n") == b".":
+                return b"".join(lines)
+            # Undo dot-stuffing
+            lines.append(line[1:] if line.startswith(b"..") else line)
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply(f"220 {server.hostname} stub SMTP ready")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command, _, argument = line.decode(errors="replace").strip().partition(" ")
+            command = command.upper()
+            if command == "EHLO":
+                self.reply(f"250-{server.hostname}")
+                self.reply("250 8BITMIME")
+            elif command == "HELO":
+                self.reply(f"250 {server.hostname}")
+            elif command == "MAIL":
+                sender, recipients = argument.partition(":")[2].strip().strip("<>"), []
+                self.reply("250 OK")
+            elif command == "RCPT":
+                recipients.append(argument.partition(":")[2].strip().strip("<>"))
+                self.reply("250 OK")
+            elif command == "DATA":
+                if not recipients:
+                    self.reply("503 need RCPT first")
+                    continue
+                self.reply("354 end data with <CR><LF>.<CR><LF>")
+                data = self.read_data()
+                with server.lock:
+                    server.messages.append((sender, recipients, data))
+                if server.verbose:
+                    print(f"{sender} -> {', '.join(recipients)}: {len(data)} bytes")
+                sender, recipients = None, []
+                self.reply("250 OK queued")
+            elif command == "RSET":
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif command == "NOOP":
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 command not implemented")
+
+
+class StubSMTPServer(ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+# Starts the stub on a background thread and returns the server; its port attribute is
+# what SMTP_PORT should be set to. Port 0 picks a free port.
+def start_stub_smtp_server(host="127.0.0.1", port=0, verbose=False):
+    server = StubSMTPServer((host, port), StubSMTPHandler)
+    server.hostname = host
+    server.port = server.server_address[1]
+    server.verbose = verbose
+    server.messages = []
+    server.connections = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local debugging SMTP server that accepts and prints every message")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+    server = start_stub_smtp_server(args.host, args.port, verbose=True)
+    print(f"Stub SMTP server listening on {args.host}:{server.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.database import create_connection, create_tables
+
+
+# A fresh, fully migrated database with one user and two accounts
+@pytest.fixture
+def db(tmp_path):
+    connection = create_connection(str(tmp_path / "finance.db"))
+    create_tables(connection)
+    connection.execute("INSERT INTO users (username, email, password) VALUES ('user1', 'user1@email.com', 'x');")
+    connection.executemany(
+        "INSERT INTO accounts (accountno, userid, balance, type, interest_rate, reference) VALUES (?, 1, ?, 'current', 0, '');",
+        [("ACC00001", 100.0), ("ACC00002", 0.0)],
+    )
+    connection.commit()
+    yield connection
+    connection.close()
+
+
+# Writes csv rows (accountno, date, time, category, value, ref) to a file and returns its path
+@pytest.fixture
+def statement(tmp_path):
+    count = iter(range(1000))
+
+    def write(rows):
+        path = tmp_path / f"statement{next(count)}.csv"
+        path.write_text("".join(",".join(row) + "\n" for row in rows))
+        return str(path)
+    return write
@@ -0,0 +1,73 @@
+from database.database import add_transaction, get_balance, ingest_transaction_file, rebuild_daily_totals
+from utils import Transaction
+
+
+def rows(count, start=0, accountno="ACC00001"):
+    return [(accountno, "2024-01-02", f"{10 + i // 60:02d}:{i % 60:02d}", "dining", f"{-(i + 1):.2f}", f"shop {i}") for i in range(start, start + count)]
+
+
+def transaction_count(db):
+    return db.execute("SELECT COUNT(*) FROM transactions;").fetchone()[0]
+
+
+def account_balance(db, accountno):
+    return db.execute("SELECT balance FROM accounts WHERE accountno = ?;", (accountno,)).fetchone()[0]
+
+
+def rollup(db):
+    return sorted(db.execute("SELECT accountno, day, category, round(total, 2), count FROM daily_account_category_totals;").fetchall())
+
+
+def test_same_file_twice_is_skipped(db, statement):
+    path = statement(rows(10))
+    first = ingest_transaction_file(db, path)
+    second = ingest_transaction_file(db, path)
+
+    assert (first["inserted"], first["skipped"]) == (10, False)
+    assert (second["inserted"], second["skipped"]) == (0, True)
+    assert transaction_count(db) == 10
+    assert db.execute("SELECT COUNT(*) FROM imports;").fetchone()[0] == 1
+
+
+def test_overlapping_statements_insert_only_new_rows(db, statement):
+    ingest_transaction_file(db, statement(rows(10)))
+    stats = ingest_transaction_file(db, statement(rows(10, start=5)))
+
+    assert (stats["rows"], stats["inserted"], stats["duplicates"]) == (10, 5, 5)
+    assert transaction_count(db) == 15
+
+
+def test_identical_rows_in_one_statement_are_kept(db, statement):
+    same = rows(1) * 3
+    assert ingest_transaction_file(db, statement(same))["inserted"] == 3
+    # A later statement holding the same three rows and a fourth copy only adds the fourth
+    stats = ingest_transaction_file(db, statement(same + rows(1)))
+    assert (stats["inserted"], stats["duplicates"]) == (1, 3)
+    assert transaction_count(db) == 4
+
+
+def test_balance_and_rollup_stay_consistent_after_dedupe(db, statement):
+    ingest_transaction_file(db, statement(rows(10) + rows(4, accountno="ACC00002")))
+    ingest_transaction_file(db, statement(rows(15) + rows(4, accountno="ACC00002")))
+
+    assert account_balance(db, "ACC00001") == 100.0 + get_balance(db, "ACC00001")
+    assert account_balance(db, "ACC00002") == get_balance(db, "ACC00002")
+    assert get_balance(db, "ACC00001") == -sum(range(1, 16))
+
+    incremental = rollup(db)
+    rebuild_daily_totals(db)
+    assert incremental == rollup(db)
+
+
+def test_hand_added_transaction_is_not_imported_again(db, statement):
+    add_transaction(db, Transaction("ACC00001", -1.0, "dining", 2024, 1, 2, 10, 0, "shop 0"))
+    stats = ingest_transaction_file(db, statement(rows(2)))
+
+    assert (stats["inserted"], stats["duplicates"]) == (1, 1)
+    assert transaction_count(db) == 2
+
+
+def test_ingest_restores_in_memory_temp_store(db, statement):
+    db.execute("PRAGMA temp_store = MEMORY;")
+    ingest_transaction_file(db, statement(rows(3)))
+    assert db.execute("PRAGMA temp_store;").fetchone()[0] == 2
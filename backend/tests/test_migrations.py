@@ -0,0 +1,58 @@
+import sqlite3
+
+from database.migrations import MIGRATIONS, SCHEMA_VERSION, check_query_plans, get_schema_version, migrate
+
+
+# The schema and some data as they were before any migration
+def unmigrated_database(path):
+    connection = sqlite3.connect(path)
+    connection.executescript('''
+        CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, email TEXT NOT NULL, password TEXT NOT NULL);
+        CREATE TABLE accounts (accountno TEXT PRIMARY KEY, userid INTEGER NOT NULL, balance REAL NOT NULL, type TEXT NOT NULL,
+            interest_rate REAL DEFAULT 0, reference TEXT);
+        CREATE TABLE transactions (id INTEGER PRIMARY KEY AUTOINCREMENT, accountno TEXT NOT NULL, ref TEXT NOT NULL,
+            val REAL NOT NULL, time TIMESTAMP DEFAULT CURRENT_TIMESTAMP, category TEXT);
+        CREATE TABLE conversation (dialogue TEXT DEFAULT "");
+        INSERT INTO users (username, email, password) VALUES ('user1', 'user1@email.com', 'x');
+        INSERT INTO accounts VALUES ('ACC00001', 1, 0, 'current', 0, '');
+        INSERT INTO transactions (accountno, ref, val, time, category) VALUES
+            ('ACC00001', 'coffee', -3.5, '2024-01-02 10:00:00', 'dining'),
+            ('ACC00001', 'coffee', -3.5, '2024-01-02 10:00:00', 'dining'),
+            ('ACC00001', 'rent', -500, '2024-01-03 09:00:00', 'rent');
+    ''')
+    return connection
+
+
+def schema(connection):
+    return sorted(connection.execute("SELECT type, name, sql FROM sqlite_master;").fetchall(), key=lambda row: (row[0], row[1]))
+
+
+def test_migrates_an_existing_database(tmp_path):
+    connection = unmigrated_database(str(tmp_path / "finance.db"))
+    assert get_schema_version(connection) == 0
+
+    assert migrate(connection) == SCHEMA_VERSION == MIGRATIONS[-1][0]
+    assert get_schema_version(connection) == SCHEMA_VERSION
+    # Existing rows are backfilled: identical transactions get distinct fingerprints
+    fingerprints = [row[0] for row in connection.execute("SELECT fingerprint FROM transactions ORDER BY id;")]
+    assert None not in fingerprints and len(set(fingerprints)) == 3
+    assert fingerprints[0].endswith("|1") and fingerprints[1].endswith("|2")
+    totals = connection.execute("SELECT day, category, total, count FROM daily_account_category_totals ORDER BY day;").fetchall()
+    assert totals == [("2024-01-02", "dining", -7.0, 2), ("2024-01-03", "rent", -500.0, 1)]
+    assert connection.execute("SELECT COUNT(*) FROM transactions_fts WHERE transactions_fts MATCH 'coffee';").fetchone()[0] == 2
+    connection.close()
+
+
+def test_migrating_twice_changes_nothing(tmp_path):
+    connection = unmigrated_database(str(tmp_path / "finance.db"))
+    migrate(connection)
+    before = schema(connection), connection.execute("SELECT * FROM transactions ORDER BY id;").fetchall()
+
+    assert migrate(connection) == SCHEMA_VERSION
+    assert (schema(connection), connection.execute("SELECT * FROM transactions ORDER BY id;").fetchall()) == before
+    connection.close()
+
+
+def test_query_plans_use_indexes(db):
+    for name, (uses_index, plan) in check_query_plans(db).items():
+        assert uses_index, f"{name}: {plan}"
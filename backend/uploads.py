@@ -0,0 +1,107 @@
+from database import validate_transaction_row
+from time import perf_counter
+import csv
+import io
+import os
+import uuid
+
+# Largest accepted upload, and the most row errors reported back for one upload
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_MB", 50)) * 1024 * 1024
+UPLOAD_MAX_ERRORS = int(os.getenv("UPLOAD_MAX_ERRORS", 100))
+# Bytes read from the request per block
+UPLOAD_BUFFER_SIZE = 64 * 1024
+
+
+# Raised when an upload is larger than it is allowed to be
+class UploadTooLarge(Exception):
+    pass
+
+
+# Wraps a binary stream, counting the bytes read through it and raising UploadTooLarge
+# once more than <max_bytes> have gone by. Closing it leaves the wrapped stream open.
+class LimitedReader(io.RawIOBase):
+    def __init__(self, stream, max_bytes=UPLOAD_MAX_BYTES):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        block = self.stream.read(len(buffer))
+        if not block:
+            return 0
+        self.size += len(block)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"upload is larger than {self.max_bytes} bytes")
+        buffer[:len(block)] = block
+        return len(block)
+
+
+# Returns a fresh path in <directory> for an upload with the given extension
+def unique_upload_path(directory, extension):
+    return os.path.join(directory, f"{uuid.uuid4().hex}{extension}")
+
+
+# Copies a binary stream to <path> block by block. Returns the bytes written and seconds taken.
+def save_upload(stream, path, max_bytes=UPLOAD_MAX_BYTES):
+    start = perf_counter()
+    reader = LimitedReader(stream, max_bytes)
+    try:
+        with open(path, "wb") as out:
+            while True:
+                block = reader.read(UPLOAD_BUFFER_SIZE)
+                if not block:
+                    break
+                out.write(block)
+    except BaseException:
+        os.remove(path)
+        raise
+    return {"bytes": reader.size, "seconds": perf_counter() - start}
+
+
+# Reads a transaction csv from a binary stream one row at a time, validating each row as it
+# arrives and writing the valid ones to <path> for the ingest job. Only the current block is
+# held in memory, so several large statements can be received in parallel. Returns the
+# accepted and rejected row counts, the first <max_errors> row errors with their line numbers,
+# the bytes read and the seconds taken. The file is removed again if no row was valid.
+def receive_transaction_csv(stream, path, max_bytes=UPLOAD_MAX_BYTES, max_errors=UPLOAD_MAX_ERRORS):
+    start = perf_counter()
+    accepted = 0
+    rejected = 0
+    errors = []
+    reader = LimitedReader(stream, max_bytes)
+    text = io.TextIOWrapper(io.BufferedReader(reader, UPLOAD_BUFFER_SIZE), encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        with open(path, "w", newline="") as out:
+            writer = csv.writer(out)
+            rows = csv.reader(text)
+            for row in rows:
+                if not any(field.strip() for field in row):
+                    continue
+                try:
+                    validate_transaction_row(row)
+                except ValueError as e:
+                    rejected += 1
+                    if len(errors) < max_errors:
+                        errors.append({"line": rows.line_num, "error": str(e)})
+                    continue
+                writer.writerow(row)
+                accepted += 1
+    except BaseException:
+        os.remove(path)
+        raise
+    finally:
+        text.close()
+
+    if not accepted:
+        os.remove(path)
+    return {
+        "rows": accepted,
+        "rejected": rejected,
+        "errors": errors,
+        "errors_truncated": rejected > len(errors),
+        "bytes": reader.size,
+        "seconds": perf_counter() - start,
+    }
@@ -0,0 +1,85 @@
+from collections import OrderedDict
+from database import get_user
+import os
+import threading
+import time
+
+# Seconds a loaded user is reused before it is read from the database again, and the most
+# users kept. Every process has its own cache, so a change made through another process is
+# seen here at the latest after the TTL.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+
+
+# Per-process LRU of User objects by username, each entry expiring after a TTL. Flask-Login
+# loads the user on every authenticated request; with this only the first request in each
+# TTL window queries the database.
+class UserCache:
+    def __init__(self, max_entries=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    '''Returns the cached user for username, or None when it is missing or has expired'''
+    def get(self, username):
+        with self._lock:
+            entry = self._users.get(username)
+            if entry is not None and entry[0] > time.monotonic():
+                self._users.move_to_end(username)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._users[username]
+            self.misses += 1
+            return None
+
+    def put(self, user):
+        with self._lock:
+            self._users[user.username] = (time.monotonic() + self.ttl, user)
+            self._users.move_to_end(user.username)
+            while len(self._users) > self.max_entries:
+                self._users.popitem(last=False)
+
+    '''Drops one user, or every user when username is None'''
+    def invalidate(self, username=None):
+        with self._lock:
+            if username is None:
+                self._users.clear()
+            else:
+                self._users.pop(username, None)
+
+    '''Returns the user from the cache, loading and caching it on a miss. <get_connection>
+    is only called on a miss, so cache hits never take a database connection.'''
+    def load(self, get_connection, username):
+        user = self.get(username)
+        if user is None:
+            user = get_user(get_connection(), username)
+            if user is not None:
+                self.put(user)
+        return user
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._users),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Returns the process-wide user cache
+def get_user_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = UserCache()
+    return _cache
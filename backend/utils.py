@@ -1,11 +1,5 @@
 from datetime import datetime
 from flask_login import UserMixin
-from classifier import classify_item
-from read_receipt import read_receipt
-import pytesseract
-from classifier import classify_item
-from PIL import Image
-from gpt import run_model
 
 class Transaction:
     def __init__(self, accountno, value, category, year, month, day, hour, minute, ref):
@@ -24,16 +18,20 @@ class Account:
         self.interest_rate = interest_rate
         self.reference = reference
     
-    '''Takes a future date and returns the balance at that date using the interest rate and current balance'''
+    '''Takes a future date and returns the balance at that date using the interest rate and current balance.
+    The interest rate is an annual percentage, compounded monthly; only whole months count.'''
     def calculate_future_balance(self, future_date):
         if self.balance == 0 or self.interest_rate == 0:
             return self.balance
         
-        if future_date < datetime.now():
+        now = datetime.now()
+        if future_date < now:
             raise Exception("Error: Date given is before current date.")
         
-        months = (future_date - datetime.now()).month
-        return self.balance * ((1 + self.interest_rate)**months)
+        months = (future_date.year - now.year) * 12 + future_date.month - now.month
+        if future_date.day < now.day:
+            months -= 1
+        return self.balance * ((1 + self.interest_rate / 100 / 12)**months)
     
 class User(UserMixin):
     def __self__(self, username, email, password):
@@ -45,20 +43,26 @@ class User(UserMixin):
         return self.username
     
 
+RECEIPT_LABELS = [
+    "Food",
+    "Transportation",
+    "Utilities",
+    "Health/Medical",
+    "Clothing/Apparel",
+    "Entertainment",
+    "Miscellaneous"
+]
+
+# The OCR, classifier and model modules are imported on first use, so importing utils
+# (which every database query does, for User) stays cheap
 def classify_image(file_path):
-    image = Image.open(file_path)
-    text = pytesseract.image_to_string(image)
-    candidate_labels = [
-        "Food",
-        "Transportation",
-        "Utilities",
-        "Health/Medical",
-        "Clothing/Apparel",
-        "Entertainment",
-        "Miscellaneous"
-    ]
+    from classifier import classify_item
+    from gpt import run_model
+    from ocr import get_ocr_service
+
+    text = get_ocr_service().read_text(file_path)
 
-    category = classify_item(text, candidate_labels)
+    category = classify_item(text, RECEIPT_LABELS)
     price = run_model("image", text)
 
     return (category, price)
\ No newline at end of file
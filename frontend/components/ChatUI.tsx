@@ -1,5 +1,4 @@
-import React, { useState, useEffect, useRef } from "react";
-import axios from "axios";
+import React, { useState, useRef } from "react";
 import { v4 as uuidv4 } from "uuid"; // Install uuid for unique IDs
 
 interface Message {
@@ -15,7 +14,6 @@ const ChatUI: React.FC = () => {
     const [isTyping, setIsTyping] = useState(false);
     const [uploadedImage, setUploadedImage] = useState<string | null>(null);
     const messagesEndRef = useRef<HTMLDivElement | null>(null);
-    const typingIntervalRef = useRef<NodeJS.Timeout | null>(null); // To store the interval ID
 
     // const scrollToBottom = () => {
     //     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -37,49 +35,71 @@ const ChatUI: React.FC = () => {
         setShowBanner(false);
         setIsTyping(true);
 
+        const botMessage: Message = {
+            id: uuidv4(),
+            sender: "bot",
+            text: "",
+        };
+        setMessages((prevMessages) => [...prevMessages, botMessage]);
+
+        const appendToBotMessage = (token: string) => {
+            setMessages((prevMessages) =>
+                prevMessages.map((msg) =>
+                    msg.id === botMessage.id
+                        ? { ...msg, text: msg.text + token }
+                        : msg
+                )
+            );
+        };
+
         try {
-            const response = await axios.post("http://127.0.0.1:5000/chat", {
-                message: input,
+            // Ask for a server-sent event stream so tokens show up as they arrive
+            const response = await fetch("http://127.0.0.1:5000/chat", {
+                method: "POST",
+                credentials: "include",
+                headers: {
+                    "Content-Type": "application/json",
+                    Accept: "text/event-stream",
+                },
+                body: JSON.stringify({ message: input, stream: true }),
             });
-
-            const botMessage: Message = {
-                id: uuidv4(),
-                sender: "bot",
-                text: "",
-            };
-            setMessages((prevMessages) => [...prevMessages, botMessage]);
-
-            const botResponse: string = response.data.response;
-            let index = -1;
-
-            // Clear any existing interval
-            if (typingIntervalRef.current) {
-                clearInterval(typingIntervalRef.current);
+            if (!response.ok || !response.body) {
+                throw new Error("Network response was not ok");
             }
 
-            typingIntervalRef.current = setInterval(() => {
-                index++;
-                if (index < botResponse.length) {
-                    setMessages((prevMessages) =>
-                        prevMessages.map((msg) =>
-                            msg.id === botMessage.id
-                                ? {
-                                      ...msg,
-                                      text: msg.text + botResponse[index],
-                                  }
-                                : msg
-                        )
-                    );
-                } else {
-                    if (typingIntervalRef.current) {
-                        clearInterval(typingIntervalRef.current);
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = "";
+
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                const events = buffer.split("\n\n");
+                buffer = events.pop() ?? "";
+                for (const event of events) {
+                    const lines = event.split("\n");
+                    const type = lines
+                        .find((line) => line.startsWith("event: "))
+                        ?.slice(7);
+                    const payload = lines
+                        .find((line) => line.startsWith("data: "))
+                        ?.slice(6);
+                    if (!payload) continue;
+
+                    const parsed = JSON.parse(payload);
+                    if (type === "error") {
+                        throw new Error(parsed.error);
+                    }
+                    if (parsed.token) {
+                        appendToBotMessage(parsed.token);
                     }
-                    typingIntervalRef.current = null;
-                    setIsTyping(false);
                 }
-            }, 1);
+            }
         } catch (error) {
             console.error("Error sending message:", error);
+        } finally {
             setIsTyping(false);
         }
 
@@ -104,15 +124,6 @@ const ChatUI: React.FC = () => {
         }
     };
 
-    // Cleanup on unmount
-    useEffect(() => {
-        return () => {
-            if (typingIntervalRef.current) {
-                clearInterval(typingIntervalRef.current);
-            }
-        };
-    }, []);
-
     return (
         <div className="chat-container bg-white p-6 rounded-xl shadow-md max-w-lg mx-auto border border-gray-200">
             {showBanner && (
@@ -5,5 +5,8 @@ Set-Location .\backend
 Write-Host "Activating Virtual Environment"
 .\venv\Scripts\Activate
 
+Write-Host "Starting background job workers"
+Start-Process python3.11 -ArgumentList "jobs.py" -NoNewWindow
+
 Write-Host "Starting Flask Server"
-python3.11 app.py
\ No newline at end of file
+python3.11 app.py --seed
\ No newline at end of file
@@ -5,5 +5,8 @@ cd ./backend || exit
 echo "Activating Virtual Environment"
 source ./venv/bin/activate
 
+echo "Starting background job workers"
+python jobs.py &
+
 echo "Starting Flask Server"
-python app.py &
\ No newline at end of file
+python app.py --seed &
\ No newline at end of file